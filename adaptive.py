@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+
+from main import CHILD_OPERATORS
+
+
+def population_diversity(similarity):
+    if len(similarity) < 2:
+        return 1.0
+    off_diagonal = similarity[~np.eye(len(similarity), dtype=bool)]
+    return 1.0 - float(off_diagonal.mean())
+
+
+class OperatorStats:
+    __slots__ = ("uses", "gain", "seconds", "recent_gain", "recent_seconds")
+
+    def __init__(self, uses=0, gain=0.0, seconds=0.0, recent_gain=0.0, recent_seconds=0.0):
+        self.uses = uses
+        self.gain = gain
+        self.seconds = seconds
+        self.recent_gain = recent_gain
+        self.recent_seconds = recent_seconds
+
+    @property
+    def rate(self):
+        if self.recent_seconds <= 0:
+            return 0.0
+        return self.recent_gain / self.recent_seconds
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class OperatorBandit:
+    def __init__(self, operators=CHILD_OPERATORS, plan_length=4, min_probability=0.1, decay=0.9, min_trials=3):
+        if min_probability * len(operators) > 1:
+            raise ValueError("min_probability is too large for this number of operators")
+        self.operators = tuple(operators)
+        self.plan_length = plan_length
+        self.min_probability = min_probability
+        self.decay = decay
+        self.min_trials = min_trials
+        self.stats = {operator: OperatorStats() for operator in self.operators}
+
+    def record(self, operator, gain, seconds):
+        stats = self.stats.get(operator)
+        if stats is None:
+            return
+        stats.uses += 1
+        stats.gain += gain
+        stats.seconds += seconds
+        stats.recent_gain = self.decay * stats.recent_gain + gain
+        stats.recent_seconds = self.decay * stats.recent_seconds + seconds
+
+    def record_log(self, operator_log):
+        for operator, gain, seconds in operator_log:
+            self.record(operator, gain, seconds)
+
+    def probabilities(self):
+        untried = [operator for operator in self.operators if self.stats[operator].uses < self.min_trials]
+        if untried:
+            quality = [1.0 if operator in untried else 0.0 for operator in self.operators]
+        else:
+            quality = [max(self.stats[operator].rate, 0.0) for operator in self.operators]
+        total = sum(quality)
+        if total <= 0:
+            return [1.0 / len(self.operators)] * len(self.operators)
+        spare = 1.0 - self.min_probability * len(self.operators)
+        return [self.min_probability + spare * value / total for value in quality]
+
+    def plan(self):
+        return tuple(random.choices(self.operators, weights=self.probabilities(), k=self.plan_length))
+
+    def summary(self):
+        return {
+            operator: {
+                "uses": stats.uses,
+                "mean_gain": stats.gain / stats.uses if stats.uses else 0.0,
+                "cpu_seconds": stats.seconds,
+                "gain_per_second": stats.rate,
+                "probability": probability,
+            }
+            for (operator, stats), probability in zip(self.stats.items(), self.probabilities())
+        }
+
+    def state(self):
+        return {operator: stats.to_dict() for operator, stats in self.stats.items()}
+
+    def load_state(self, state):
+        for operator, values in state.items():
+            if operator in self.stats:
+                self.stats[operator] = OperatorStats(**values)
@@ -0,0 +1,150 @@
+from collections import deque
+
+from classes import Day, ProblemIndex
+
+
+class FlowNetwork:
+    def __init__(self):
+        self.nodes = {}
+        self.edges = []
+        self.targets = []
+        self.capacities = []
+
+    def node(self, name):
+        node_id = self.nodes.get(name)
+        if node_id is None:
+            node_id = len(self.edges)
+            self.nodes[name] = node_id
+            self.edges.append([])
+        return node_id
+
+    def add_edge(self, source, target, capacity):
+        source, target = self.node(source), self.node(target)
+        self.edges[source].append(len(self.targets))
+        self.targets.append(target)
+        self.capacities.append(capacity)
+        self.edges[target].append(len(self.targets))
+        self.targets.append(source)
+        self.capacities.append(0)
+
+    def levels(self, source, sink):
+        level = [-1] * len(self.edges)
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for edge in self.edges[node]:
+                target = self.targets[edge]
+                if level[target] < 0 and self.capacities[edge] > 0:
+                    level[target] = level[node] + 1
+                    queue.append(target)
+        return level if level[sink] >= 0 else None
+
+    def augment(self, source, sink, level, next_edge):
+        path = []
+        node = source
+        while True:
+            if node == sink:
+                bottleneck = min(self.capacities[edge] for edge in path)
+                for edge in path:
+                    self.capacities[edge] -= bottleneck
+                    self.capacities[edge ^ 1] += bottleneck
+                return bottleneck
+            edges = self.edges[node]
+            while next_edge[node] < len(edges):
+                edge = edges[next_edge[node]]
+                if self.capacities[edge] > 0 and level[self.targets[edge]] == level[node] + 1:
+                    break
+                next_edge[node] += 1
+            else:
+                if not path:
+                    return 0
+                level[node] = -1
+                edge = path.pop()
+                node = self.targets[edge ^ 1]
+                next_edge[node] += 1
+                continue
+            path.append(edge)
+            node = self.targets[edge]
+
+    def max_flow(self, source, sink):
+        source, sink = self.node(source), self.node(sink)
+        total = 0
+        while True:
+            level = self.levels(source, sink)
+            if level is None:
+                return total
+            next_edge = [0] * len(self.edges)
+            while True:
+                pushed = self.augment(source, sink, level, next_edge)
+                if not pushed:
+                    break
+                total += pushed
+
+    def flow(self, source, target):
+        source, target = self.nodes[source], self.nodes[target]
+        return sum(
+            self.capacities[edge ^ 1] for edge in self.edges[source]
+            if edge % 2 == 0 and self.targets[edge] == target
+        )
+
+
+def course_units(groups, week_quantity):
+    for group in groups:
+        for subject in group.subjects:
+            for detail in subject.details:
+                lessons_per_week = int((detail.hours / 1.5 - 1) // week_quantity) + 1
+                subgroup_count = int(detail.subgroups) if detail.type == "Lab" else 1
+                for subgroup in range(1, subgroup_count + 1):
+                    subgroup_name = None
+                    if subgroup_count != 1:
+                        subgroup_name = f"{subgroup}/{subgroup_count}"
+                    yield (group.name, subject.name, detail.type, subgroup_name), lessons_per_week
+
+
+def teacher_allocation(groups, teachers, week_quantity, problem_index=None, max_lessons_per_day=4):
+    if problem_index is None:
+        problem_index = ProblemIndex(groups, teachers, [])
+
+    units = {}
+    for key, lessons_per_week in course_units(groups, week_quantity):
+        if key not in units:
+            units[key] = lessons_per_week
+    teacher_lessons = {}
+    for teacher in teachers:
+        teacher_lessons.setdefault(teacher.name, min(int(teacher.hours // 1.5), len(Day) * max_lessons_per_day))
+
+    network = FlowNetwork()
+    for key, lessons_per_week in units.items():
+        eligible_teachers = problem_index.eligible_teachers(key[1], key[2])
+        if not eligible_teachers:
+            raise Exception(f"No available teachers for {key[1]}, {key[2]}, {key[0]}")
+        network.add_edge("source", ("unit", key), lessons_per_week)
+        for teacher in eligible_teachers:
+            network.add_edge(("unit", key), ("teacher", teacher.name), lessons_per_week)
+    for name, lessons in teacher_lessons.items():
+        network.add_edge(("teacher", name), "sink", lessons)
+    network.max_flow("source", "sink")
+
+    allocation = {}
+    spare_lessons = dict(teacher_lessons)
+    unallocated = []
+    for key, lessons_per_week in units.items():
+        teacher_flows = [
+            (network.flow(("unit", key), ("teacher", teacher.name)), teacher.name)
+            for teacher in problem_index.eligible_teachers(key[1], key[2])
+        ]
+        lessons, name = max(teacher_flows, key=lambda teacher_flow: teacher_flow[0])
+        if lessons <= 0:
+            unallocated.append((key, lessons_per_week))
+            continue
+        allocation[key] = name
+        spare_lessons[name] -= lessons_per_week
+    for key, lessons_per_week in unallocated:
+        name = max(
+            (teacher.name for teacher in problem_index.eligible_teachers(key[1], key[2])),
+            key=lambda name: spare_lessons[name]
+        )
+        allocation[key] = name
+        spare_lessons[name] -= lessons_per_week
+    return allocation
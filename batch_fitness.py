@@ -0,0 +1,184 @@
+from collections import Counter
+
+import numpy as np
+
+from compact import ScheduleEncoding
+from fitness_ledger import FitnessLedger
+from main import ProblemIndex
+
+
+ROW_FIELDS = ("day", "lesson_num", "teacher", "subject", "lesson_type", "group", "auditorium")
+
+
+def encode_population(schedules, encoding, row_cache=None):
+    if row_cache is None:
+        row_cache = {}
+    rows = []
+    for schedule in schedules:
+        for lesson in schedule.lessons:
+            row = row_cache.get(lesson)
+            if row is None:
+                row = (
+                    int(lesson.day),
+                    lesson.lesson_num,
+                    encoding.intern("teacher", lesson.teacher),
+                    encoding.intern("subject", lesson.subject),
+                    encoding.intern("lesson_type", lesson.lesson_type),
+                    encoding.intern("group", lesson.group),
+                    encoding.intern("auditorium", lesson.auditorium),
+                )
+                row_cache[lesson] = row
+            rows.append(row)
+    matrix = np.array(rows, dtype=np.int64).reshape(len(rows), len(ROW_FIELDS))
+    arrays = dict(zip(ROW_FIELDS, matrix.T))
+    arrays["schedule"] = np.repeat(
+        np.arange(len(schedules), dtype=np.int64), [len(schedule.lessons) for schedule in schedules]
+    )
+    return arrays
+
+
+def group_runs(keys, values):
+    order = np.lexsort((values, keys))
+    keys = keys[order]
+    values = values[order]
+    same_key = keys[1:] == keys[:-1]
+    return keys, values, same_key
+
+
+class BatchFitness:
+    def __init__(self, groups, teachers, auditoriums, week_quantity, encoding=None, problem_index=None,
+                 row_cache_size=100000):
+        if problem_index is None:
+            problem_index = ProblemIndex(groups, teachers, auditoriums)
+        if encoding is None:
+            encoding = ScheduleEncoding.from_problem(groups, teachers, auditoriums)
+        self.groups = groups
+        self.teachers = teachers
+        self.auditoriums = auditoriums
+        self.week_quantity = week_quantity
+        self.encoding = encoding
+        self.problem_index = problem_index
+        self.row_cache_size = row_cache_size
+        self.row_cache = {}
+        self.tables = None
+        self.table_sizes = None
+
+    def lookup_tables(self):
+        values = self.encoding.values
+        table_sizes = tuple(len(values[table]) for table in ScheduleEncoding.TABLES)
+        if self.table_sizes == table_sizes:
+            return self.tables
+
+        teacher_entries = [self.encoding.intern("teacher", teacher.name) for teacher in self.teachers]
+        problem_index = self.problem_index
+        group_weight = Counter(group.name for group in self.groups)
+        teacher_weight = Counter(teacher.name for teacher in self.teachers)
+        group_names = values["group"]
+        subject_names = values["subject"]
+        lesson_types = values["lesson_type"]
+
+        detail_hours = np.full((len(group_names), len(subject_names), len(lesson_types)), np.nan)
+        detail_subgroups = np.ones_like(detail_hours)
+        for group_id, group_name in enumerate(group_names):
+            for (subject_name, lesson_type), detail in problem_index.details_by_group.get(group_name, {}).items():
+                subject_id = self.encoding.ids["subject"].get(subject_name)
+                type_id = self.encoding.ids["lesson_type"].get(lesson_type)
+                if subject_id is None or type_id is None:
+                    continue
+                detail_hours[group_id, subject_id, type_id] = detail.hours
+                detail_subgroups[group_id, subject_id, type_id] = detail.subgroups or 1
+
+        self.tables = {
+            "group_weight": np.array([group_weight[name] for name in group_names], dtype=np.float64),
+            "teacher_weight": np.array([teacher_weight[name] for name in values["teacher"]], dtype=np.float64),
+            "students": np.array([problem_index.students_by_group.get(name, 0) for name in group_names],
+                                 dtype=np.int64),
+            "capacity": np.array([problem_index.capacity_by_auditorium.get(number, 0)
+                                  for number in values["auditorium"]], dtype=np.int64),
+            "teacher_entries": np.array(teacher_entries, dtype=np.int64),
+            "teacher_hours": np.array([teacher.hours for teacher in self.teachers], dtype=np.float64),
+            "detail_hours": detail_hours,
+            "detail_subgroups": detail_subgroups,
+        }
+        self.table_sizes = tuple(len(values[table]) for table in ScheduleEncoding.TABLES)
+        return self.tables
+
+    def windows(self, schedule_ids, owner, weight, day, lesson_num, count):
+        if not len(owner):
+            return np.zeros(count)
+        day_key = (schedule_ids * len(weight) + owner) * 8 + day
+        keys, lesson_nums, same_key = group_runs(day_key, lesson_num)
+        is_window = same_key & (np.diff(lesson_nums) > 1)
+        window_keys = keys[1:][is_window]
+        window_owner = (window_keys // 8) % len(weight)
+        return np.bincount(window_keys // 8 // len(weight), weights=weight[window_owner], minlength=count)
+
+    def components(self, arrays, count):
+        tables = self.lookup_tables()
+        schedule_ids = arrays["schedule"]
+        day = arrays["day"]
+        lesson_num = arrays["lesson_num"]
+        group = arrays["group"]
+        teacher = arrays["teacher"]
+        auditorium = arrays["auditorium"]
+        slot = day * 64 + lesson_num
+
+        window_group_penalty = self.windows(schedule_ids, group, tables["group_weight"], day, lesson_num, count)
+        window_teacher_penalty = self.windows(schedule_ids, teacher, tables["teacher_weight"], day, lesson_num,
+                                              count)
+
+        auditorium_count = len(tables["capacity"])
+        room_key = (schedule_ids * auditorium_count + auditorium) * 512 + slot
+        room_keys, room_index = np.unique(room_key, return_inverse=True)
+        room_students = np.bincount(room_index, weights=tables["students"][group])
+        overload = np.maximum(room_students - tables["capacity"][room_keys // 512 % auditorium_count], 0)
+        capacity_penalty = np.bincount(room_keys // 512 // auditorium_count, weights=overload, minlength=count)
+
+        teacher_count = len(tables["teacher_weight"])
+        teacher_slot_keys = np.unique((schedule_ids * teacher_count + teacher) * 512 + slot)
+        teacher_hours = np.bincount(teacher_slot_keys // 512, minlength=count * teacher_count).reshape(
+            count, teacher_count
+        ) * 1.5
+        weekly_hours_penalty = np.maximum(
+            teacher_hours[:, tables["teacher_entries"]] - tables["teacher_hours"], 0
+        ).sum(axis=1)
+
+        subject_shape = tables["detail_hours"].shape
+        course_key = np.ravel_multi_index((schedule_ids, group, arrays["subject"], arrays["lesson_type"]),
+                                          (count,) + subject_shape)
+        course_keys, course_counts = np.unique(course_key, return_counts=True)
+        course_schedule, course_detail = np.divmod(course_keys, int(np.prod(subject_shape)))
+        detail_hours = tables["detail_hours"].ravel()[course_detail]
+        detail_subgroups = tables["detail_subgroups"].ravel()[course_detail]
+        course_weight = tables["group_weight"][np.unravel_index(course_detail, subject_shape)[0]]
+        subject_time = np.abs(course_counts * 1.5 * self.week_quantity / detail_subgroups - detail_hours)
+        overlearning_time_penalty = np.bincount(
+            course_schedule, weights=np.where(course_weight > 0, subject_time * course_weight, 0), minlength=count
+        ) / self.week_quantity
+
+        return {
+            "window_group_penalty": window_group_penalty,
+            "window_teacher_penalty": window_teacher_penalty,
+            "capacity_penalty": capacity_penalty,
+            "weekly_hours_penalty": weekly_hours_penalty,
+            "overlearning_time_penalty": overlearning_time_penalty,
+        }
+
+    def encode(self, schedules):
+        if len(self.row_cache) > self.row_cache_size:
+            self.row_cache.clear()
+        return encode_population(schedules, self.encoding, self.row_cache)
+
+    def evaluate_components(self, schedules):
+        components = self.components(self.encode(schedules), len(schedules))
+        return [
+            {component: components[component][i].item() for component in FitnessLedger.COMPONENTS}
+            for i in range(len(schedules))
+        ]
+
+    def evaluate(self, schedules):
+        components = self.components(self.encode(schedules), len(schedules))
+        scores = np.zeros(len(schedules))
+        for component in FitnessLedger.COMPONENTS:
+            scores -= components[component]
+        return scores.tolist()
@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from main import *
+
+SIZE_LADDER = (10, 50, 100, 200, 500, 1000)
+DEFAULT_SIZES = (10, 50, 100)
+STAGES = (
+    "load_data_from_excel",
+    "generate_schedule",
+    "crossover",
+    "mutation_fixed_group_subjects",
+    "fitness_soft",
+    "group_schedules",
+    "rain_effect",
+    "export_schedule_to_excel",
+)
+
+
+def problem_sizes(size):
+    return size, size, size, max(8, size // 5)
+
+
+def make_problem(size, seed, max_tries=20):
+    for offset in range(max_tries):
+        random.seed(seed + offset)
+        subjects, teachers, groups, auditoriums = test_generate(*problem_sizes(size))
+        problem_index = ProblemIndex(groups, teachers, auditoriums)
+        if all(
+                problem_index.eligible_teachers(subject.name, detail.type)
+                for group in groups for subject in group.subjects for detail in subject.details
+        ):
+            return seed + offset, groups, teachers, auditoriums, problem_index
+    raise Exception(f"No problem with full teacher coverage for size {size} after {max_tries} seeds")
+
+
+def measure(func, setup=None, repeat=3, seed=0):
+    runs = []
+    for run in range(repeat):
+        random.seed(seed + run)
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        runs.append(time.perf_counter() - start)
+
+    random.seed(seed)
+    args = setup() if setup else ()
+    tracemalloc.start()
+    func(*args)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": statistics.median(runs),
+        "runs": runs,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def benchmark_size(size, seed, week_quantity=14, population=10, repeat=3, stages=STAGES):
+    problem_seed, groups, teachers, auditoriums, problem_index = make_problem(size, seed)
+    results = {}
+
+    def build_population():
+        random.seed(seed)
+        schedules = []
+        for _ in range(population):
+            schedule = Schedule()
+            schedule.generate_schedule(groups, teachers, auditoriums, week_quantity, problem_index)
+            schedules.append((schedule, fitness_soft(schedule, groups, teachers, auditoriums, week_quantity,
+                                                     False, problem_index)))
+        return schedules
+
+    schedules_collection = build_population()
+    parent1, parent2 = schedules_collection[0][0], schedules_collection[1][0]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "input.xlsx")
+        output_path = os.path.join(tmp_dir, "schedule.xlsx")
+        save_data_to_excel(groups, teachers, auditoriums, input_path)
+
+        def generate():
+            Schedule().generate_schedule(groups, teachers, auditoriums, week_quantity, problem_index)
+
+        def export():
+            with contextlib.redirect_stdout(io.StringIO()):
+                export_schedule_to_excel(parent1, groups, auditoriums, output_path)
+
+        def rain():
+            rain_effect(schedules_collection, len(schedules_collection) + 2, teachers, auditoriums, groups,
+                        week_quantity, change_num=1, max_attempts=20, problem_index=problem_index)
+
+        stage_calls = {
+            "load_data_from_excel": (lambda: load_data_from_excel(input_path), None),
+            "generate_schedule": (generate, None),
+            "crossover": (
+                lambda: crossover(parent1, parent2, groups, teachers, week_quantity, auditoriums,
+                                  problem_index=problem_index),
+                None,
+            ),
+            "mutation_fixed_group_subjects": (
+                lambda schedule: mutation_fixed_group_subjects(schedule, groups, teachers, auditoriums,
+                                                               week_quantity, problem_index),
+                lambda: (parent1.clone(),),
+            ),
+            "fitness_soft": (
+                lambda: fitness_soft(parent1, groups, teachers, auditoriums, week_quantity, False, problem_index),
+                None,
+            ),
+            "group_schedules": (lambda: group_schedules(schedules_collection, similarity_threshold=0.8), None),
+            "rain_effect": (rain, None),
+            "export_schedule_to_excel": (export, None),
+        }
+        for stage in stages:
+            func, setup = stage_calls[stage]
+            results[stage] = measure(func, setup, repeat, seed)
+
+    return {
+        "size": size,
+        "seed": problem_seed,
+        "groups": len(groups),
+        "teachers": len(teachers),
+        "auditoriums": len(auditoriums),
+        "lessons": len(parent1.lessons),
+        "population": population,
+        "stages": results,
+    }
+
+
+def run_benchmarks(sizes, seed=0, repeat=3, population=10, stages=STAGES):
+    results = []
+    for size in sizes:
+        result = benchmark_size(size, seed, population=population, repeat=repeat, stages=stages)
+        results.append(result)
+        print(f"size {size}: " + ", ".join(
+            f"{stage} {stage_result['seconds']:.4f}s" for stage, stage_result in result["stages"].items()
+        ))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "population": population,
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.2, min_seconds=0.001):
+    baseline_by_size = {result["size"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        baseline_result = baseline_by_size.get(result["size"])
+        if baseline_result is None:
+            continue
+        for stage, stage_result in result["stages"].items():
+            baseline_stage = baseline_result["stages"].get(stage)
+            if baseline_stage is None:
+                continue
+            for metric in ("seconds", "peak_memory_bytes"):
+                old_value = baseline_stage[metric]
+                new_value = stage_result[metric]
+                if metric == "seconds" and max(old_value, new_value) < min_seconds:
+                    continue
+                if old_value > 0 and new_value > old_value * (1 + threshold):
+                    regressions.append({
+                        "size": result["size"],
+                        "stage": stage,
+                        "metric": metric,
+                        "baseline": old_value,
+                        "current": new_value,
+                        "ratio": new_value / old_value,
+                    })
+    return regressions
+
+
+def print_regressions(regressions):
+    if not regressions:
+        print("No regressions")
+    for regression in regressions:
+        print(
+            f"REGRESSION size {regression['size']} {regression['stage']} {regression['metric']}: "
+            f"{regression['baseline']:.6g} -> {regression['current']:.6g} (x{regression['ratio']:.2f})"
+        )
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Schedule solver benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run")
+    size_options = run_parser.add_mutually_exclusive_group()
+    size_options.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    size_options.add_argument("--ladder", dest="sizes", action="store_const", const=list(SIZE_LADDER),
+                              help=f"run the full size ladder {', '.join(map(str, SIZE_LADDER))}")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--population", type=int, default=10)
+    run_parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.add_argument("--baseline")
+    run_parser.add_argument("--threshold", type=float, default=0.2)
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        current = run_benchmarks(args.sizes, args.seed, args.repeat, args.population, args.stages)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved in '{args.output}'")
+        if not args.baseline:
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+
+    regressions = compare_results(baseline, current, args.threshold)
+    print_regressions(regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
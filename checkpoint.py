@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from compact import CompactSchedule, ScheduleEncoding
+
+CHECKPOINT_VERSION = 2
+
+
+def _subjects(subjects):
+    return [[subject.name, [[detail.type, detail.hours, detail.subgroups] for detail in subject.details]]
+            for subject in subjects]
+
+
+def problem_signature(groups, teachers, auditoriums, week_quantity, teacher_allocation=None):
+    entries = sorted(
+        [json.dumps(["g", group.name, group.students_count, _subjects(group.subjects)], default=str)
+         for group in groups] +
+        [json.dumps(["t", teacher.name, teacher.hours, _subjects(teacher.subjects)], default=str)
+         for teacher in teachers] +
+        [json.dumps(["a", auditorium.number, auditorium.capacity], default=str) for auditorium in auditoriums]
+    )
+    if teacher_allocation is not None:
+        entries += sorted(json.dumps(["allocation", list(key), name]) for key, name in teacher_allocation.items())
+    entries.append(json.dumps(["w", week_quantity]))
+
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in entries:
+        digest.update(f"{entry}\n".encode())
+    return digest.hexdigest()
+
+
+def _text_array(value):
+    return np.frombuffer(json.dumps(value).encode(), dtype=np.uint8)
+
+
+def _array_text(array):
+    return json.loads(array.tobytes().decode())
+
+
+def _rng_arrays(name, rng_state):
+    if rng_state is None:
+        return {}, None
+    version, internal_state, gauss_next = rng_state
+    return {name: np.array(internal_state, dtype=np.int64)}, [version, gauss_next]
+
+
+def _rng_state(arrays, name, meta):
+    if meta is None:
+        return None
+    version, gauss_next = meta
+    return version, tuple(int(value) for value in arrays[name]), gauss_next
+
+
+def save_checkpoint(path, population, encoding, signature=None, generation=0, evaluations=0, best=None,
+                    rng_state=None, parallel_rng_state=None, state=None):
+    schedules = [schedule for schedule, _ in population]
+    fitness = [score for _, score in population]
+    if best is not None:
+        schedules.append(best[0])
+        fitness.append(best[1])
+
+    compact_schedules = [CompactSchedule.from_schedule(schedule, encoding) for schedule in schedules]
+    arrays = {
+        f"lessons_{field}": np.concatenate(
+            [compact[field] for compact in compact_schedules] or
+            [np.empty(0, dtype=CompactSchedule.DTYPES[field])]
+        ).astype(CompactSchedule.DTYPES[field], copy=False)
+        for field in CompactSchedule.FIELDS
+    }
+    arrays["offsets"] = np.cumsum([0] + [len(compact) for compact in compact_schedules], dtype=np.int64)
+    arrays["fitness"] = np.array(fitness, dtype=np.float64)
+    arrays["encoding"] = _text_array({table: encoding.values[table] for table in encoding.TABLES})
+
+    rng_arrays, rng_meta = _rng_arrays("rng_state", rng_state)
+    parallel_rng_arrays, parallel_rng_meta = _rng_arrays("parallel_rng_state", parallel_rng_state)
+    arrays.update(rng_arrays)
+    arrays.update(parallel_rng_arrays)
+    arrays["meta"] = _text_array({
+        "version": CHECKPOINT_VERSION,
+        "signature": signature,
+        "generation": generation,
+        "evaluations": evaluations,
+        "population_count": len(population),
+        "has_best": best is not None,
+        "rng": rng_meta,
+        "parallel_rng": parallel_rng_meta,
+        "state": state or {},
+    })
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+
+    meta = _array_text(arrays["meta"])
+    if meta["version"] != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {meta['version']} in '{path}'")
+
+    encoding = ScheduleEncoding()
+    for table, values in _array_text(arrays["encoding"]).items():
+        for value in values:
+            encoding.intern(table, value)
+
+    offsets = arrays["offsets"]
+    fitness = arrays["fitness"].tolist()
+    schedules = []
+    for i in range(len(offsets) - 1):
+        start, end = offsets[i], offsets[i + 1]
+        compact = CompactSchedule(encoding, {
+            field: arrays[f"lessons_{field}"][start:end] for field in CompactSchedule.FIELDS
+        })
+        schedules.append((compact.to_schedule(), fitness[i]))
+
+    population_count = meta["population_count"]
+    return {
+        "signature": meta["signature"],
+        "generation": meta["generation"],
+        "evaluations": meta["evaluations"],
+        "population": schedules[:population_count],
+        "best": schedules[population_count] if meta["has_best"] else None,
+        "rng_state": _rng_state(arrays, "rng_state", meta["rng"]),
+        "parallel_rng_state": _rng_state(arrays, "parallel_rng_state", meta["parallel_rng"]),
+        "state": meta["state"],
+    }
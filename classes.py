@@ -1,6 +1,10 @@
+from bisect import bisect_left
+from collections import defaultdict
 from enum import IntEnum
 import random
 
+from telemetry import telemetry
+
 
 class Day(IntEnum):
     MONDAY = 1
@@ -44,6 +48,8 @@ class Auditorium:
 
 
 class Lesson:
+    __slots__ = ("day", "lesson_num", "teacher", "lesson_type", "subject", "group", "auditorium", "subgroup")
+
     def __init__(
             self,
             day,
@@ -55,14 +61,46 @@ class Lesson:
             auditorium,
             subgroup=None,
     ):
-        self.day = day
-        self.lesson_num = lesson_num
-        self.teacher = teacher.name
-        self.lesson_type = lesson_type
-        self.subject = subject.name
-        self.group = group.name
-        self.auditorium = auditorium.number
-        self.subgroup = subgroup
+        self._set_fields(
+            day, lesson_num, teacher.name, lesson_type, subject.name, group.name, auditorium.number, subgroup
+        )
+
+    @classmethod
+    def from_names(cls, day, lesson_num, teacher, lesson_type, subject, group, auditorium, subgroup=None):
+        lesson = cls.__new__(cls)
+        lesson._set_fields(day, lesson_num, teacher, lesson_type, subject, group, auditorium, subgroup)
+        return lesson
+
+    def _set_fields(self, day, lesson_num, teacher, lesson_type, subject, group, auditorium, subgroup):
+        set_field = object.__setattr__
+        set_field(self, "day", day)
+        set_field(self, "lesson_num", lesson_num)
+        set_field(self, "teacher", teacher)
+        set_field(self, "lesson_type", lesson_type)
+        set_field(self, "subject", subject)
+        set_field(self, "group", group)
+        set_field(self, "auditorium", auditorium)
+        set_field(self, "subgroup", subgroup)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Lesson is immutable, use replace() to change '{name}'")
+
+    def __reduce__(self):
+        return Lesson.from_names, self.values()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def values(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def replace(self, **changes):
+        fields = dict(zip(self.__slots__, self.values()))
+        fields.update(changes)
+        return Lesson.from_names(**fields)
 
     def to_dict(self):
         return {
@@ -77,44 +115,203 @@ class Lesson:
         }
 
 
+class ProblemIndex:
+    def __init__(self, groups, teachers, auditoriums):
+        self.groups = groups
+        self.teachers = teachers
+        self.auditoriums = auditoriums
+
+        self.groups_by_name = {}
+        self.details_by_group = {}
+        for group in groups:
+            self.groups_by_name.setdefault(group.name, group)
+            if group.name not in self.details_by_group:
+                details = {}
+                for subject in group.subjects:
+                    for detail in subject.details:
+                        details.setdefault((subject.name, detail.type), detail)
+                self.details_by_group[group.name] = details
+        self.students_by_group = {name: group.students_count for name, group in self.groups_by_name.items()}
+
+        self.teachers_by_name = {}
+        self.teachers_by_subject = defaultdict(list)
+        for teacher in teachers:
+            self.teachers_by_name.setdefault(teacher.name, teacher)
+            for teacher_subject in teacher.subjects:
+                for detail in teacher_subject.details:
+                    eligible_teachers = self.teachers_by_subject[(teacher_subject.name, detail.type)]
+                    if not eligible_teachers or eligible_teachers[-1] is not teacher:
+                        eligible_teachers.append(teacher)
+
+        self.auditoriums_by_number = {}
+        for auditorium in auditoriums:
+            self.auditoriums_by_number.setdefault(auditorium.number, auditorium)
+        self.capacity_by_auditorium = {
+            number: auditorium.capacity for number, auditorium in self.auditoriums_by_number.items()
+        }
+        self.auditoriums_by_capacity = sorted(auditoriums, key=lambda a: a.capacity)
+        self._capacities = [a.capacity for a in self.auditoriums_by_capacity]
+        self.teacher_allocation = None
+
+    def eligible_teachers(self, subject_name, subj_type):
+        return self.teachers_by_subject.get((subject_name, subj_type), [])
+
+    def allocated_teacher(self, group_name, subject_name, subj_type, subgroup=None):
+        if self.teacher_allocation is None:
+            return None
+        teacher_name = self.teacher_allocation.get((group_name, subject_name, subj_type, subgroup))
+        return self.teachers_by_name.get(teacher_name)
+
+    def course_teachers(self, group_name, subject_name, subj_type, subgroup=None):
+        teacher = self.allocated_teacher(group_name, subject_name, subj_type, subgroup)
+        if teacher is not None:
+            return [teacher]
+        return self.eligible_teachers(subject_name, subj_type)
+
+    def auditoriums_for(self, students_count, strict=False):
+        auditoriums = self.auditoriums_by_capacity[bisect_left(self._capacities, students_count):]
+        if not auditoriums and not strict:
+            return self.auditoriums_by_capacity
+        return auditoriums
+
+    def subject_detail(self, group_name, subject_name, subj_type):
+        return self.details_by_group[group_name].get((subject_name, subj_type))
+
+
 class Schedule:
     def __init__(self):
         self.lessons = []
+        self._positions = {}
+        self.teacher_slots = {}
+        self.group_slots = {}
+        self.auditorium_slots = {}
+        self.teacher_slot_counts = {}
+        self.ledger = None
+        self._cache = {}
+
+    def __getstate__(self):
+        return {"lessons": self.lessons, "ledger": self.ledger}
+
+    def __setstate__(self, state):
+        self.__init__()
+        for lesson in state["lessons"]:
+            self.add_lesson(lesson)
+        self.ledger = state["ledger"]
+
+    def __contains__(self, lesson):
+        return lesson in self._positions
+
+    def clone(self):
+        new_schedule = Schedule.__new__(Schedule)
+        new_schedule.lessons = self.lessons.copy()
+        new_schedule._positions = self._positions.copy()
+        new_schedule.teacher_slots = self.teacher_slots.copy()
+        new_schedule.group_slots = self.group_slots.copy()
+        new_schedule.auditorium_slots = self.auditorium_slots.copy()
+        new_schedule.teacher_slot_counts = self.teacher_slot_counts.copy()
+        new_schedule.ledger = self.ledger.copy() if self.ledger is not None else None
+        new_schedule._cache = self._cache.copy()
+        return new_schedule
+
+    def cached(self, key, build):
+        value = self._cache.get(key)
+        if value is None:
+            value = build(self)
+            self._cache[key] = value
+        return value
+
+    def add_lesson(self, lesson):
+        if self._cache:
+            self._cache.clear()
+        self._positions[lesson] = len(self.lessons)
+        self.lessons.append(lesson)
+        teacher_key = (lesson.teacher, lesson.day, lesson.lesson_num)
+        if teacher_key not in self.teacher_slots:
+            self.teacher_slot_counts[lesson.teacher] = self.teacher_slot_counts.get(lesson.teacher, 0) + 1
+        self._add_to_slot(self.teacher_slots, teacher_key, lesson)
+        self._add_to_slot(self.group_slots, (lesson.group, lesson.day, lesson.lesson_num), lesson)
+        self._add_to_slot(self.auditorium_slots, (lesson.auditorium, lesson.day, lesson.lesson_num), lesson)
+        if self.ledger is not None:
+            self.ledger.add_lesson(lesson)
+
+    def remove_lesson(self, lesson):
+        if self._cache:
+            self._cache.clear()
+        position = self._positions.pop(lesson)
+        last_lesson = self.lessons.pop()
+        if last_lesson is not lesson:
+            self.lessons[position] = last_lesson
+            self._positions[last_lesson] = position
+        teacher_key = (lesson.teacher, lesson.day, lesson.lesson_num)
+        self._remove_from_slot(self.teacher_slots, teacher_key, lesson)
+        if teacher_key not in self.teacher_slots:
+            self.teacher_slot_counts[lesson.teacher] -= 1
+        self._remove_from_slot(self.group_slots, (lesson.group, lesson.day, lesson.lesson_num), lesson)
+        self._remove_from_slot(self.auditorium_slots, (lesson.auditorium, lesson.day, lesson.lesson_num), lesson)
+        if self.ledger is not None:
+            self.ledger.remove_lesson(lesson)
+
+    def teacher_hours(self, teacher_name):
+        return self.teacher_slot_counts.get(teacher_name, 0) * 1.5
+
+    def choose_teacher(self, teachers, balance_load=False, planned_hours=None):
+        if not balance_load:
+            return random.choice(teachers)
+        weights = []
+        for teacher in teachers:
+            spare_hours = teacher.hours - self.teacher_hours(teacher.name)
+            if planned_hours:
+                spare_hours -= planned_hours.get(teacher.name, 0)
+            weights.append(max(spare_hours, 0) + 1.5)
+        return random.choices(teachers, weights=weights)[0]
+
+    def schedule_position(self, lesson):
+        return self._positions[lesson]
+
+    def in_schedule_order(self, lessons):
+        return sorted(lessons, key=self._positions.__getitem__)
+
+    def replace_lesson(self, lesson, new_lesson):
+        self.remove_lesson(lesson)
+        self.add_lesson(new_lesson)
+
+    @staticmethod
+    def _add_to_slot(index, key, lesson):
+        index[key] = index.get(key, ()) + (lesson,)
+
+    @staticmethod
+    def _remove_from_slot(index, key, lesson):
+        slot_lessons = tuple(existing_lesson for existing_lesson in index[key] if existing_lesson is not lesson)
+        if slot_lessons:
+            index[key] = slot_lessons
+        else:
+            del index[key]
 
     def check_hard_constraints(self, lesson):
-        for existing_lesson in self.lessons:
+        if telemetry.enabled:
+            telemetry.count("check_hard_constraints")
+        for existing_lesson in self.teacher_slots.get((lesson.teacher, lesson.day, lesson.lesson_num), ()):
             if lesson != existing_lesson:
-                if (
-                        existing_lesson.teacher == lesson.teacher
-                        and existing_lesson.day == lesson.day
-                        and existing_lesson.lesson_num == lesson.lesson_num
-                ):
-                    if not (
-                            existing_lesson.lesson_type == "Lec" and lesson.lesson_type == "Lec"
-                            and existing_lesson.subject == lesson.subject and
-                            existing_lesson.auditorium == lesson.auditorium
-                    ):
-                        return False
-                if (
-                        existing_lesson.group == lesson.group
-                        and existing_lesson.day == lesson.day
-                        and existing_lesson.lesson_num == lesson.lesson_num
-                        and (existing_lesson.subgroup is None or lesson.subgroup is None or
-                             existing_lesson.subgroup[-1] != lesson.subgroup[-1] or
-                             existing_lesson.subgroup == lesson.subgroup)
+                if not (
+                        existing_lesson.lesson_type == "Lec" and lesson.lesson_type == "Lec"
+                        and existing_lesson.subject == lesson.subject and
+                        existing_lesson.auditorium == lesson.auditorium
                 ):
                     return False
-                if (
-                        existing_lesson.auditorium == lesson.auditorium
-                        and existing_lesson.day == lesson.day
-                        and existing_lesson.lesson_num == lesson.lesson_num
+        for existing_lesson in self.group_slots.get((lesson.group, lesson.day, lesson.lesson_num), ()):
+            if lesson != existing_lesson:
+                if (existing_lesson.subgroup is None or lesson.subgroup is None or
+                        existing_lesson.subgroup[-1] != lesson.subgroup[-1] or
+                        existing_lesson.subgroup == lesson.subgroup):
+                    return False
+        for existing_lesson in self.auditorium_slots.get((lesson.auditorium, lesson.day, lesson.lesson_num), ()):
+            if lesson != existing_lesson:
+                if not (
+                        existing_lesson.lesson_type == "Lec" and lesson.lesson_type == "Lec"
+                        and existing_lesson.subject == lesson.subject and
+                        existing_lesson.teacher == lesson.teacher
                 ):
-                    if not (
-                            existing_lesson.lesson_type == "Lec" and lesson.lesson_type == "Lec"
-                            and existing_lesson.subject == lesson.subject and
-                            existing_lesson.teacher == lesson.teacher
-                    ):
-                        return False
+                    return False
         return True
 
     def hard_constraints_schedule_check(self):
@@ -123,35 +320,128 @@ class Schedule:
                 return False
         return True
 
-    def set_shared_lec(self, lesson, teacher, subject, group, auditoriums):
-        for existing_lesson in self.lessons:
+    def set_shared_lec(self, lesson):
+        for existing_lesson in self.teacher_slots.get((lesson.teacher, lesson.day, lesson.lesson_num), ()):
             if lesson != existing_lesson:
                 if (
-                        existing_lesson.teacher == lesson.teacher
-                        and existing_lesson.day == lesson.day
-                        and existing_lesson.lesson_num == lesson.lesson_num
+                        existing_lesson.lesson_type == "Lec" and lesson.lesson_type == "Lec"
+                        and existing_lesson.subject == lesson.subject
                 ):
-                    if (
-                            existing_lesson.lesson_type == "Lec" and lesson.lesson_type == "Lec"
-                            and existing_lesson.subject == lesson.subject
-                    ):
-                        auditorium = next((a for a in auditoriums if a.number == existing_lesson.auditorium), None)
-                        new_lesson = Lesson(
-                            lesson.day,
-                            lesson.lesson_num,
-                            teacher,
-                            lesson.lesson_type,
-                            subject,
-                            group,
-                            auditorium,
-                            lesson.subgroup,
-                        )
-                        return self.check_hard_constraints(lesson), new_lesson
+                    new_lesson = lesson.replace(auditorium=existing_lesson.auditorium)
+                    return self.check_hard_constraints(lesson), new_lesson
         return False, lesson
 
-    def generate_schedule(self, groups, teachers, auditoriums, week_quantity):
+    def group_slot_free(self, group_name, day, lesson_num, subgroup=None):
+        for existing_lesson in self.group_slots.get((group_name, day, lesson_num), ()):
+            if (existing_lesson.subgroup is None or subgroup is None or
+                    existing_lesson.subgroup[-1] != subgroup[-1] or
+                    existing_lesson.subgroup == subgroup):
+                return False
+        return True
+
+    def teacher_slot_state(self, teacher_name, day, lesson_num, lesson_type, subject_name):
+        teacher_lessons = self.teacher_slots.get((teacher_name, day, lesson_num))
+        if not teacher_lessons:
+            return True, None
+        shared_auditorium = teacher_lessons[0].auditorium
+        for existing_lesson in teacher_lessons:
+            if not (
+                    existing_lesson.lesson_type == "Lec" and lesson_type == "Lec"
+                    and existing_lesson.subject == subject_name
+                    and existing_lesson.auditorium == shared_auditorium
+            ):
+                return False, None
+        return True, shared_auditorium
+
+    def free_auditoriums(self, auditoriums, day, lesson_num):
+        return [a for a in auditoriums if (a.number, day, lesson_num) not in self.auditorium_slots]
+
+    def shared_lecture_fits(self, auditorium_number, day, lesson_num, group_name, problem_index):
+        total_students = problem_index.students_by_group.get(group_name, 0) + sum(
+            problem_index.students_by_group.get(existing_lesson.group, 0)
+            for existing_lesson in self.auditorium_slots.get((auditorium_number, day, lesson_num), ())
+        )
+        return total_students <= problem_index.capacity_by_auditorium.get(auditorium_number, total_students)
+
+    def feasible_placements(self, group_name, subgroup, teacher_name, lesson_type, subject_name, auditoriums,
+                            problem_index=None, days=tuple(Day), max_lessons_per_day=4):
+        slots = [
+            (day, lesson_num)
+            for day in days
+            for lesson_num in range(1, max_lessons_per_day + 1)
+            if self.group_slot_free(group_name, day, lesson_num, subgroup)
+        ]
+        random.shuffle(slots)
+        for day, lesson_num in slots:
+            teacher_free, shared_auditorium = self.teacher_slot_state(
+                teacher_name, day, lesson_num, lesson_type, subject_name
+            )
+            if not teacher_free:
+                continue
+            if shared_auditorium is not None:
+                if problem_index is None or self.shared_lecture_fits(
+                        shared_auditorium, day, lesson_num, group_name, problem_index
+                ):
+                    yield day, lesson_num, [shared_auditorium]
+                continue
+            free_auditoriums = self.free_auditoriums(auditoriums, day, lesson_num)
+            if free_auditoriums:
+                yield day, lesson_num, [a.number for a in free_auditoriums]
+
+    def place_lesson(self, teacher, lesson_type, subject, group, subgroup, auditoriums, problem_index=None):
+        for day, lesson_num, auditorium_numbers in self.feasible_placements(
+                group.name, subgroup, teacher.name, lesson_type, subject.name, auditoriums, problem_index
+        ):
+            lesson = Lesson.from_names(
+                day, lesson_num, teacher.name, lesson_type, subject.name, group.name,
+                random.choice(auditorium_numbers), subgroup,
+            )
+            if self.check_hard_constraints(lesson):
+                self.add_lesson(lesson)
+                return lesson
+        return None
+
+    def lesson_requests(self, groups, week_quantity, problem_index, balance_teacher_load=False):
+        requests = []
+        planned_hours = defaultdict(float)
+        for group in groups:
+            for subject in group.subjects:
+                for detail in subject.details:
+                    lesson_quantity = detail.hours / 1.5
+                    subgroup_count = (
+                        int(detail.subgroups) if detail.type == "Lab" else 1
+                    )
+                    available_teachers = problem_index.eligible_teachers(subject.name, detail.type)
+                    if not available_teachers:
+                        raise Exception(f"No available teachers for {subject.name}, {detail.type}, {group.name}")
+
+                    teacher = problem_index.allocated_teacher(group.name, subject.name, detail.type) or \
+                        self.choose_teacher(available_teachers, balance_teacher_load, planned_hours)
+                    for _ in range(int((lesson_quantity - 1) // week_quantity) + 1):
+                        for subgroup in range(1, subgroup_count + 1):
+                            subgroup_name = None
+                            if detail.type != "Lec" and subgroup_count != 1:
+                                subgroup_name = f"{subgroup}/{subgroup_count}"
+                            if subgroup_count > 1:
+                                teacher = problem_index.allocated_teacher(
+                                    group.name, subject.name, detail.type, subgroup_name
+                                ) or self.choose_teacher(available_teachers, balance_teacher_load, planned_hours)
+                            requests.append((group, subject, detail.type, subgroup_name, teacher))
+                            planned_hours[teacher.name] += 1.5
+        return requests
+
+    def generate_schedule(self, groups, teachers, auditoriums, week_quantity, problem_index=None, mode="random",
+                          most_constrained_first=False, balance_teacher_load=False):
+        if problem_index is None:
+            problem_index = ProblemIndex(groups, teachers, auditoriums)
+        if mode == "enumerate":
+            return self.generate_schedule_by_enumeration(groups, week_quantity, problem_index,
+                                                         most_constrained_first, balance_teacher_load)
+        if mode != "random":
+            raise ValueError(f"Unknown construction mode: {mode}")
         max_lessons_per_day = 4
         days = list(Day)
+        unplaced = []
 
         for group in groups:
             for subject in group.subjects:
@@ -162,19 +452,13 @@ class Schedule:
                     subgroup_count = (
                         int(detail.subgroups) if lesson_type == "Lab" else 1
                     )
-                    available_teachers = [
-                        t
-                        for t in teachers
-                        if any(
-                            ts.name == subject.name
-                            and detail.type in [tsd.type for tsd in ts.details]
-                            for ts in t.subjects
-                        )
-                    ]
+                    available_teachers = problem_index.eligible_teachers(subject.name, detail.type)
+                    group_auditoriums = problem_index.auditoriums_for(group.students_count)
                     if not available_teachers:
                         raise Exception(f"No available teachers for {subject.name}, {lesson_type}, {group.name}")
 
-                    teacher = random.choice(available_teachers)
+                    teacher = problem_index.allocated_teacher(group.name, subject.name, lesson_type) or \
+                        self.choose_teacher(available_teachers, balance_teacher_load)
                     for _ in range(int((lesson_quantity - 1) // week_quantity) + 1):
                         for subgroup in range(1, subgroup_count + 1):
                             subgroup = f"{subgroup}/{subgroup_count}"
@@ -182,23 +466,12 @@ class Schedule:
                             loop_num = 0
                             while not assigned and loop_num < 100:
                                 if subgroup_count > 1:
-                                    teacher = random.choice(available_teachers)
+                                    teacher = problem_index.allocated_teacher(
+                                        group.name, subject.name, lesson_type, subgroup
+                                    ) or self.choose_teacher(available_teachers, balance_teacher_load)
                                 day = random.choice(days)
                                 lesson_num = random.randint(1, max_lessons_per_day)
-                                auditorium = random.choice(
-                                    [
-                                        a
-                                        for a in auditoriums
-                                        if a.capacity >= group.students_count
-                                    ]
-                                )
-                                if not auditorium:
-                                    auditorium = random.choice(
-                                        [
-                                            a
-                                            for a in auditoriums
-                                        ]
-                                    )
+                                auditorium = random.choice(group_auditoriums)
 
                                 if lesson_type == "Lec" or subgroup_count == 1:
                                     subgroup = None
@@ -215,12 +488,61 @@ class Schedule:
                                 )
 
                                 if lesson_type == "Lec":
-                                    result_flag, new_lesson = self.set_shared_lec(lesson, teacher, subject,
-                                                                                  group, auditoriums)
+                                    result_flag, new_lesson = self.set_shared_lec(lesson)
                                     if result_flag:
                                         lesson = new_lesson
 
                                 loop_num += 1
                                 if self.check_hard_constraints(lesson):
-                                    self.lessons.append(lesson)
+                                    self.add_lesson(lesson)
                                     assigned = True
+                            if not assigned:
+                                unplaced.append({
+                                    "group": group.name,
+                                    "subject": subject.name,
+                                    "type": lesson_type,
+                                    "subgroup": subgroup,
+                                    "teacher": teacher.name,
+                                })
+                            if telemetry.enabled:
+                                telemetry.count("placement_retries", loop_num - 1)
+                                if not assigned:
+                                    telemetry.count("lessons_dropped_generate")
+        return unplaced
+
+    def generate_schedule_by_enumeration(self, groups, week_quantity, problem_index, most_constrained_first=False,
+                                         balance_teacher_load=False):
+        requests = self.lesson_requests(groups, week_quantity, problem_index, balance_teacher_load)
+        if most_constrained_first:
+            teacher_load = defaultdict(int)
+            group_load = defaultdict(int)
+            for group, _, _, _, teacher in requests:
+                teacher_load[teacher.name] += 1
+                group_load[group.name] += 1
+            requests.sort(key=lambda request: (
+                len(problem_index.auditoriums_for(request[0].students_count)),
+                -teacher_load[request[4].name],
+                -group_load[request[0].name],
+            ))
+
+        unplaced = []
+        for group, subject, lesson_type, subgroup, teacher in requests:
+            group_auditoriums = problem_index.auditoriums_for(group.students_count)
+            if self.place_lesson(teacher, lesson_type, subject, group, subgroup, group_auditoriums,
+                                 problem_index) is None:
+                has_common_slot = any(
+                    self.group_slot_free(group.name, day, lesson_num, subgroup) and
+                    self.teacher_slot_state(teacher.name, day, lesson_num, lesson_type, subject.name)[0]
+                    for day in Day for lesson_num in range(1, 5)
+                )
+                unplaced.append({
+                    "group": group.name,
+                    "subject": subject.name,
+                    "type": lesson_type,
+                    "subgroup": subgroup,
+                    "teacher": teacher.name,
+                    "reason": "no free auditorium" if has_common_slot else "no common free slot",
+                })
+                if telemetry.enabled:
+                    telemetry.count("lessons_dropped_generate")
+        return unplaced
@@ -0,0 +1,146 @@
+import numpy as np
+
+from classes import Day, Lesson, Schedule
+
+
+class ScheduleEncoding:
+    TABLES = ("teacher", "subject", "lesson_type", "group", "auditorium")
+
+    def __init__(self):
+        self.values = {table: [] for table in self.TABLES}
+        self.ids = {table: {} for table in self.TABLES}
+
+    @classmethod
+    def from_problem(cls, groups, teachers, auditoriums):
+        encoding = cls()
+        # Every process builds its own encoding, so all codes must come from the problem in a fixed order.
+        for lesson_type in ("Lec", "Lab"):
+            encoding.intern("lesson_type", lesson_type)
+        for group in groups:
+            encoding.intern("group", group.name)
+            for subject in group.subjects:
+                encoding.intern("subject", subject.name)
+                for detail in subject.details:
+                    encoding.intern("lesson_type", detail.type)
+        for teacher in teachers:
+            encoding.intern("teacher", teacher.name)
+            for subject in teacher.subjects:
+                encoding.intern("subject", subject.name)
+                for detail in subject.details:
+                    encoding.intern("lesson_type", detail.type)
+        for auditorium in auditoriums:
+            encoding.intern("auditorium", auditorium.number)
+        return encoding
+
+    def intern(self, table, value):
+        ids = self.ids[table]
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = len(ids)
+            ids[value] = value_id
+            self.values[table].append(value)
+        return value_id
+
+    def value(self, table, value_id):
+        return self.values[table][value_id]
+
+
+class CompactSchedule:
+    # Storage and transfer encoding for checkpoints and island migration; the search itself runs on Schedule.
+    FIELDS = (
+        "day",
+        "lesson_num",
+        "teacher",
+        "subject",
+        "lesson_type",
+        "group",
+        "auditorium",
+        "subgroup_index",
+        "subgroup_count",
+    )
+    DTYPES = {
+        "day": np.int8,
+        "lesson_num": np.int8,
+        "teacher": np.int32,
+        "subject": np.int32,
+        "lesson_type": np.int8,
+        "group": np.int32,
+        "auditorium": np.int32,
+        "subgroup_index": np.int8,
+        "subgroup_count": np.int8,
+    }
+
+    def __init__(self, encoding, arrays=None):
+        self.encoding = encoding
+        if arrays is None:
+            arrays = {field: np.empty(0, dtype=self.DTYPES[field]) for field in self.FIELDS}
+        self.arrays = arrays
+
+    @classmethod
+    def from_lessons(cls, lessons, encoding):
+        columns = {field: [] for field in cls.FIELDS}
+        for lesson in lessons:
+            subgroup_index, subgroup_count = parse_subgroup(lesson.subgroup)
+            columns["day"].append(int(lesson.day))
+            columns["lesson_num"].append(lesson.lesson_num)
+            columns["teacher"].append(encoding.intern("teacher", lesson.teacher))
+            columns["subject"].append(encoding.intern("subject", lesson.subject))
+            columns["lesson_type"].append(encoding.intern("lesson_type", lesson.lesson_type))
+            columns["group"].append(encoding.intern("group", lesson.group))
+            columns["auditorium"].append(encoding.intern("auditorium", lesson.auditorium))
+            columns["subgroup_index"].append(subgroup_index)
+            columns["subgroup_count"].append(subgroup_count)
+        arrays = {field: np.array(columns[field], dtype=cls.DTYPES[field]) for field in cls.FIELDS}
+        return cls(encoding, arrays)
+
+    @classmethod
+    def from_schedule(cls, schedule, encoding):
+        return cls.from_lessons(schedule.lessons, encoding)
+
+    def __len__(self):
+        return len(self.arrays["day"])
+
+    def __getitem__(self, field):
+        return self.arrays[field]
+
+    def to_lessons(self):
+        encoding = self.encoding
+        teachers = encoding.values["teacher"]
+        subjects = encoding.values["subject"]
+        lesson_types = encoding.values["lesson_type"]
+        groups = encoding.values["group"]
+        auditoriums = encoding.values["auditorium"]
+        rows = zip(*(self.arrays[field].tolist() for field in self.FIELDS))
+        return [
+            Lesson.from_names(
+                Day(day),
+                lesson_num,
+                teachers[teacher],
+                lesson_types[lesson_type],
+                subjects[subject],
+                groups[group],
+                auditoriums[auditorium],
+                format_subgroup(subgroup_index, subgroup_count),
+            )
+            for (day, lesson_num, teacher, subject, lesson_type, group, auditorium,
+                 subgroup_index, subgroup_count) in rows
+        ]
+
+    def to_schedule(self):
+        schedule = Schedule()
+        for lesson in self.to_lessons():
+            schedule.add_lesson(lesson)
+        return schedule
+
+
+def parse_subgroup(subgroup):
+    if subgroup is None:
+        return 0, 0
+    index, count = subgroup.split("/")
+    return int(index), int(count)
+
+
+def format_subgroup(subgroup_index, subgroup_count):
+    if not subgroup_count:
+        return None
+    return f"{subgroup_index}/{subgroup_count}"
@@ -1,7 +1,11 @@
+import csv
+import hashlib
+import json
+import os
 from collections import defaultdict
+from itertools import islice
 
 import openpyxl
-import pandas as pd
 
 from classes import *
 
@@ -45,125 +49,317 @@ def parse_teachers_subjects(text):
     return subjects
 
 
-def load_data_from_excel(file_path):
-    workbook = openpyxl.load_workbook(file_path)
-    sheet1 = workbook["Groups"]
+INPUT_SHEETS = ("Groups", "Teachers", "Auditoriums")
+INPUT_CACHE_VERSION = 2
+
+
+def parse_number(value):
+    if isinstance(value, str):
+        value = float(value)
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def parse_groups_rows(rows):
     groups = []
-    for row in sheet1.iter_rows(min_row=2, values_only=True):
-        if row[0] is None:
+    for row in rows:
+        if not row or row[0] in (None, ""):
             break
         group_name = row[0]
-        students_count = row[1]
+        students_count = parse_number(row[1])
         pi_text = row[2]
         subjects = parse_groups_subjects(pi_text)
         groups.append(Group(group_name, students_count, subjects))
+    return groups
+
 
-    sheet2 = workbook["Teachers"]
+def parse_teachers_rows(rows):
     teachers = []
-    for row in sheet2.iter_rows(min_row=2, values_only=True):
-        if row[0] is None:
+    for row in rows:
+        if not row or row[0] in (None, ""):
             break
         teacher_name = row[0]
         subjects_list = row[1]
-        hours = row[2]
+        hours = parse_number(row[2])
 
         subjects = parse_teachers_subjects(subjects_list)
         teachers.append(Teacher(teacher_name, subjects, hours))
+    return teachers
 
-    sheet3 = workbook["Auditoriums"]
+
+def parse_auditoriums_rows(rows):
     auditoriums = []
-    for row in sheet3.iter_rows(min_row=2, values_only=True):
-        if row[0] is None:
+    for row in rows:
+        if not row or row[0] in (None, ""):
             break
         num = row[0]
-        capacity = row[1]
+        capacity = parse_number(row[1])
         auditoriums.append(Auditorium(num, capacity))
-    return groups, teachers, auditoriums
+    return auditoriums
 
 
-def export_schedule_to_excel(schedule_to_save, groups, auditoriums, filename="schedule.xlsx"):
-    lesson_dicts = [
-        {
-            **lesson.to_dict(),
-            "day_num": lesson.day.value,
+def parse_input_rows(groups_rows, teachers_rows, auditoriums_rows):
+    return parse_groups_rows(groups_rows), parse_teachers_rows(teachers_rows), \
+        parse_auditoriums_rows(auditoriums_rows)
+
+
+def excel_input_rows(file_path):
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        return {
+            sheet: [list(row) for row in workbook[sheet].iter_rows(min_row=2, values_only=True)]
+            for sheet in INPUT_SHEETS
         }
-        for lesson in schedule_to_save.lessons
-    ]
-    df = pd.DataFrame(lesson_dicts)
-
-    column_for_group_order = [
-        "Group",
-        "Day",
-        "Lesson_num",
-        "Subject",
-        "Lesson_type",
-        "Teacher",
-        "Subgroup",
-        "Auditorium",
-    ]
-    column_for_teacher_order = [
-        "Teacher",
-        "Day",
-        "Lesson_num",
-        "Subject",
-        "Lesson_type",
-        "Group",
-        "Subgroup",
-        "Auditorium",
-    ]
-
-    sorted_by_group = (
-        df[column_for_group_order + ["day_num"]]
-        .sort_values(by=["Group", "day_num", "Lesson_num"])
-        .drop(columns=["day_num"])
-    )
+    finally:
+        workbook.close()
 
-    sorted_by_teacher = (
-        df[column_for_teacher_order + ["day_num"]]
-        .sort_values(by=["Teacher", "day_num", "Lesson_num"])
-        .drop(columns=["day_num"])
-    )
 
-    auditorium_data = defaultdict(lambda: defaultdict(list))
+def csv_input_paths(path):
+    return [os.path.join(path, f"{sheet}.csv") for sheet in INPUT_SHEETS]
 
-    for lesson in schedule_to_save.lessons:
-        auditorium_data[lesson.auditorium][(lesson.day, lesson.lesson_num)].append(lesson)
 
-    group_student_count = {}
-    for group in groups:
-        group_student_count[group.name] = group.students_count
-
-    auditorium_records = []
-    for auditorium_num, lessons_by_day in auditorium_data.items():
-        for (day, lesson_num), lessons in lessons_by_day.items():
-            groups = [lesson.group for lesson in lessons]
-            total_students = sum(group_student_count[group] for group in groups)
-            auditorium_capacity = next(a.capacity for a in auditoriums if a.number == auditorium_num)
-
-            auditorium_records.append({
-                "Auditorium": auditorium_num,
-                "Day": Day(day).name,
-                "Lesson_num": lesson_num,
-                "Subject": lessons[0].subject,
-                "Groups": ", ".join(set(groups)),
-                "Subgroup": ", ".join(str(lesson.subgroup) for lesson in lessons if lesson.subgroup),
-                "Total_students": total_students,
-                "Capacity": auditorium_capacity,
-            })
-
-    sorted_by_auditorium = pd.DataFrame(auditorium_records)
-
-    sorted_by_auditorium = sorted_by_auditorium.sort_values(
-        by=["Auditorium", "Day", "Lesson_num"],
-        ascending=[True, True, True]
+def csv_input_rows(path):
+    rows = {}
+    for sheet, sheet_path in zip(INPUT_SHEETS, csv_input_paths(path)):
+        with open(sheet_path, newline="", encoding="utf-8") as f:
+            rows[sheet] = list(csv.reader(f))[1:]
+    return rows
+
+
+def json_input_rows(file_path):
+    with open(file_path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {sheet: data[sheet] for sheet in INPUT_SHEETS}
+
+
+def input_rows(path):
+    if os.path.isdir(path):
+        return csv_input_rows(path)
+    if path.lower().endswith(".json"):
+        return json_input_rows(path)
+    return excel_input_rows(path)
+
+
+def parse_input_sheets(rows):
+    return parse_input_rows(*(rows[sheet] for sheet in INPUT_SHEETS))
+
+
+def load_data_from_excel(file_path):
+    return parse_input_sheets(excel_input_rows(file_path))
+
+
+def load_data_from_csv(path):
+    return parse_input_sheets(csv_input_rows(path))
+
+
+def load_data_from_json(file_path):
+    return parse_input_sheets(json_input_rows(file_path))
+
+
+def input_paths(path):
+    if os.path.isdir(path):
+        return csv_input_paths(path)
+    return [path]
+
+
+def input_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{INPUT_CACHE_VERSION}".encode())
+    for input_path in input_paths(path):
+        digest.update(os.path.basename(input_path).encode())
+        with open(input_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_data(path, cache_dir=None):
+    if not cache_dir:
+        return parse_input_sheets(input_rows(path))
+
+    cache_path = os.path.join(cache_dir, f"{input_hash(path)}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            return parse_input_sheets(json.load(f))
+
+    rows = input_rows(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, cache_path)
+    return parse_input_sheets(rows)
+
+
+def format_groups_subjects(subjects):
+    parts = []
+    for subject in subjects:
+        details = []
+        for detail in subject.details:
+            detail_text = f"{detail.type}|{detail.hours:g}"
+            if detail.subgroups is not None:
+                detail_text += f"|{detail.subgroups}"
+            details.append(detail_text)
+        parts.append(f"{subject.name} ({', '.join(details)})")
+    return " - ".join(parts)
+
+
+def format_teachers_subjects(subjects):
+    return ", ".join(
+        f"{subject.name} ({'|'.join(detail.type for detail in subject.details)})" for subject in subjects
     )
 
-    with pd.ExcelWriter(filename) as writer:
-        sorted_by_group.to_excel(writer, sheet_name="Sorted_By_Groups", index=False)
-        sorted_by_teacher.to_excel(writer, sheet_name="Sorted_By_Teachers", index=False)
-        sorted_by_auditorium.to_excel(writer, sheet_name="Sorted_By_Auditorium", index=False)
 
-    print(f"Saved in '{filename}'")
+def save_data_to_excel(groups, teachers, auditoriums, file_path):
+    workbook = openpyxl.Workbook()
+    sheet1 = workbook.active
+    sheet1.title = "Groups"
+    sheet1.append(["Group", "Students", "Subjects"])
+    for group in groups:
+        sheet1.append([group.name, group.students_count, format_groups_subjects(group.subjects)])
+
+    sheet2 = workbook.create_sheet("Teachers")
+    sheet2.append(["Teacher", "Subjects", "Hours"])
+    for teacher in teachers:
+        sheet2.append([teacher.name, format_teachers_subjects(teacher.subjects), teacher.hours])
+
+    sheet3 = workbook.create_sheet("Auditoriums")
+    sheet3.append(["Auditorium", "Capacity"])
+    for auditorium in auditoriums:
+        sheet3.append([auditorium.number, auditorium.capacity])
+    workbook.save(file_path)
+
+
+GROUP_COLUMNS = ["Group", "Day", "Lesson_num", "Subject", "Lesson_type", "Teacher", "Subgroup", "Auditorium"]
+TEACHER_COLUMNS = ["Teacher", "Day", "Lesson_num", "Subject", "Lesson_type", "Group", "Subgroup", "Auditorium"]
+AUDITORIUM_COLUMNS = ["Auditorium", "Day", "Lesson_num", "Subject", "Groups", "Subgroup", "Total_students",
+                      "Capacity"]
+EXPORT_FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+
+
+def group_sheet_rows(lessons):
+    for lesson in sorted(lessons, key=lambda lesson: (lesson.group, lesson.day, lesson.lesson_num)):
+        yield (lesson.group, lesson.day.name, lesson.lesson_num, lesson.subject, lesson.lesson_type, lesson.teacher,
+               lesson.subgroup, lesson.auditorium)
+
+
+def teacher_sheet_rows(lessons):
+    for lesson in sorted(lessons, key=lambda lesson: (lesson.teacher, lesson.day, lesson.lesson_num)):
+        yield (lesson.teacher, lesson.day.name, lesson.lesson_num, lesson.subject, lesson.lesson_type, lesson.group,
+               lesson.subgroup, lesson.auditorium)
+
+
+def auditorium_sheet_rows(lessons, group_student_count, auditorium_capacity):
+    auditorium_data = defaultdict(list)
+    for lesson in lessons:
+        auditorium_data[(lesson.auditorium, lesson.day.name, lesson.lesson_num)].append(lesson)
+
+    slot_order = sorted(auditorium_data, key=lambda slot: (isinstance(slot[0], str), slot))
+    for (auditorium_num, day_name, lesson_num) in slot_order:
+        slot_lessons = auditorium_data[(auditorium_num, day_name, lesson_num)]
+        slot_groups = [lesson.group for lesson in slot_lessons]
+        yield (
+            auditorium_num,
+            day_name,
+            lesson_num,
+            slot_lessons[0].subject,
+            ", ".join(dict.fromkeys(slot_groups)),
+            ", ".join(str(lesson.subgroup) for lesson in slot_lessons if lesson.subgroup),
+            sum(group_student_count[group] for group in slot_groups),
+            auditorium_capacity[auditorium_num],
+        )
+
+
+def schedule_export_sheets(schedule_to_save, groups, auditoriums):
+    group_student_count = {group.name: group.students_count for group in groups}
+    auditorium_capacity = {auditorium.number: auditorium.capacity for auditorium in auditoriums}
+    lessons = schedule_to_save.lessons
+    return {
+        "Sorted_By_Groups": (GROUP_COLUMNS, group_sheet_rows(lessons)),
+        "Sorted_By_Teachers": (TEACHER_COLUMNS, teacher_sheet_rows(lessons)),
+        "Sorted_By_Auditorium": (AUDITORIUM_COLUMNS,
+                                 auditorium_sheet_rows(lessons, group_student_count, auditorium_capacity)),
+    }
+
+
+def write_sheets_xlsx(sheets, filename):
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_name, (columns, rows) in sheets.items():
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(columns)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(filename)
+
+
+def write_sheets_csv(sheets, directory):
+    os.makedirs(directory, exist_ok=True)
+    for sheet_name, (columns, rows) in sheets.items():
+        with open(os.path.join(directory, f"{sheet_name}.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+
+def write_sheets_jsonl(sheets, filename):
+    with open(filename, "w", encoding="utf-8") as f:
+        for sheet_name, (columns, rows) in sheets.items():
+            for row in rows:
+                f.write(json.dumps({"Sheet": sheet_name, **dict(zip(columns, row))}) + "\n")
+
+
+def write_sheets_parquet(sheets, filename, batch_size=10000):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow: pip install pyarrow")
+
+    # One file for all sheets, like jsonl; every column is text because Auditorium mixes numbers and names.
+    all_columns = ["Sheet", *dict.fromkeys(column for columns, _ in sheets.values() for column in columns)]
+    schema = pa.schema([(column, pa.string()) for column in all_columns])
+    with pq.ParquetWriter(filename, schema) as writer:
+        for sheet_name, (columns, rows) in sheets.items():
+            rows = iter(rows)
+            for batch in iter(lambda: list(islice(rows, batch_size)), []):
+                records = [
+                    {"Sheet": sheet_name,
+                     **{column: None if value is None else str(value) for column, value in zip(columns, row)}}
+                    for row in batch
+                ]
+                writer.write_table(pa.Table.from_pylist(records, schema=schema))
+
+
+SHEET_WRITERS = {
+    "xlsx": write_sheets_xlsx,
+    "csv": write_sheets_csv,
+    "jsonl": write_sheets_jsonl,
+    "parquet": write_sheets_parquet,
+}
+
+
+def export_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("xlsx", "xlsm"):
+        return "xlsx"
+    if extension in ("jsonl", "json"):
+        return "jsonl"
+    if extension == "parquet":
+        return "parquet"
+    return "csv"
+
+
+def export_schedule(schedule_to_save, groups, auditoriums, path, export_format_name=None):
+    export_format_name = export_format_name or export_format(path)
+    if export_format_name not in SHEET_WRITERS:
+        raise ValueError(f"Unknown export format '{export_format_name}', expected one of {EXPORT_FORMATS}")
+    SHEET_WRITERS[export_format_name](schedule_export_sheets(schedule_to_save, groups, auditoriums), path)
+    print(f"Saved in '{path}'")
+
+
+def export_schedule_to_excel(schedule_to_save, groups, auditoriums, filename="schedule.xlsx"):
+    export_schedule(schedule_to_save, groups, auditoriums, filename, "xlsx")
 
 
 def test_generate(group_q, teacher_q, aud_q, subj_q):
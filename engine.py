@@ -0,0 +1,617 @@
+import argparse
+import sys
+import time
+
+from adaptive import OperatorBandit, population_diversity
+from allocation import teacher_allocation
+from batch_fitness import BatchFitness
+from checkpoint import load_checkpoint, problem_signature, save_checkpoint
+from compact import ScheduleEncoding
+from fitness_cache import FitnessCache, drop_duplicates
+from main import *
+from telemetry import JsonlLogger, ProgressReporter
+
+
+class GeneticScheduler:
+    def __init__(self, groups, teachers, auditoriums, week_quantity=14, population_size=100, max_generations=400,
+                 survivor_ratio=0.5, retain_ratio=0.1, min_retain=4, similarity_threshold=0.8,
+                 stagnation_delta=2, rain_after=5, rain_change_num=10, rain_max_attempts=200,
+                 rain_max_loss=None,
+                 time_budget=None, max_evaluations=None, patience=None, min_improvement=0.0,
+                 construction_mode="random", balance_teacher_load=False, workers=1, seed=None, verbose=False,
+                 checkpoint_path=None, checkpoint_every=10, fitness_cache_size=10000, keep_duplicates=False,
+                 batch_fitness=False, adaptive_operators=False, operator_steps=4, min_diversity=0.7,
+                 rain_cooldown=3, assign_rooms=False, allocate_teachers=False, similarity_num_perm=None,
+                 exact_similarity_limit=SIMILARITY_EXACT_LIMIT):
+        self.groups = groups
+        self.teachers = teachers
+        self.auditoriums = auditoriums
+        self.week_quantity = week_quantity
+        self.population_size = population_size
+        self.max_generations = max_generations
+        self.survivor_count = max(2, int(population_size * survivor_ratio))
+        self.retain_count = max(floor(retain_ratio * population_size), min_retain)
+        self.similarity_threshold = similarity_threshold
+        self.similarity_num_perm = similarity_num_perm
+        self.exact_similarity_limit = exact_similarity_limit
+        self.stagnation_delta = stagnation_delta
+        self.rain_after = rain_after
+        self.rain_change_num = rain_change_num
+        self.rain_max_attempts = rain_max_attempts
+        self.rain_max_loss = rain_max_loss
+        self.time_budget = time_budget
+        self.max_evaluations = max_evaluations
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.construction_mode = construction_mode
+        self.balance_teacher_load = balance_teacher_load
+        self.workers = workers
+        self.seed = seed
+        self.verbose = verbose
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.problem_index = ProblemIndex(groups, teachers, auditoriums)
+        if allocate_teachers:
+            self.problem_index.teacher_allocation = teacher_allocation(groups, teachers, week_quantity,
+                                                                       self.problem_index)
+        self.signature = problem_signature(groups, teachers, auditoriums, week_quantity,
+                                           self.problem_index.teacher_allocation)
+        self.fitness_cache = None
+        if fitness_cache_size:
+            self.fitness_cache = FitnessCache(groups, teachers, auditoriums, week_quantity, fitness_cache_size,
+                                              self.problem_index)
+        self.keep_duplicates = keep_duplicates
+        self.assign_rooms = assign_rooms
+        self.operator_bandit = None
+        if adaptive_operators:
+            operators = CHILD_OPERATORS
+            if assign_rooms:
+                operators = [operator for operator in operators if operator != "mutate_auditoriums_by_size"]
+            self.operator_bandit = OperatorBandit(operators, plan_length=operator_steps)
+        self.min_diversity = min_diversity
+        self.rain_cooldown = rain_cooldown
+        self.batch_fitness = None
+        if batch_fitness:
+            self.batch_fitness = BatchFitness(groups, teachers, auditoriums, week_quantity,
+                                              problem_index=self.problem_index)
+
+        self.population = []
+        self.elite = []
+        self.best = None
+        self.generation = 0
+        self.evaluations = 0
+        self.num_iter_no_change = (None, 0)
+        self.generations_without_improvement = 0
+        self.last_rain_generation = None
+        self.stop_reason = None
+        self.start_time = None
+        self.parallel_population = None
+        self.parallel_rng_state = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def evaluate(self, schedule):
+        if self.fitness_cache is None:
+            self.evaluations += 1
+            return fitness_soft(schedule, self.groups, self.teachers, self.auditoriums, self.week_quantity, False,
+                                self.problem_index)
+        entry = self.fitness_cache.lookup(schedule)
+        if entry is None:
+            self.evaluations += 1
+            entry = self.fitness_cache.compute(schedule)
+        return entry[0]
+
+    def evaluate_all(self, schedules):
+        if self.batch_fitness is None:
+            return [self.evaluate(schedule) for schedule in schedules]
+        scores = [None] * len(schedules)
+        missing = []
+        for i, schedule in enumerate(schedules):
+            entry = self.fitness_cache.lookup(schedule) if self.fitness_cache is not None else None
+            if entry is None:
+                missing.append(i)
+            else:
+                scores[i] = entry[0]
+        if missing:
+            missing_schedules = [schedules[i] for i in missing]
+            self.evaluations += len(missing)
+            for i, schedule, components in zip(missing, missing_schedules,
+                                               self.batch_fitness.evaluate_components(missing_schedules)):
+                scores[i] = components_score(components)
+                if self.fitness_cache is not None:
+                    self.fitness_cache.store(schedule, scores[i], components)
+        return scores
+
+    def remember(self, items):
+        if self.fitness_cache is not None:
+            for schedule, score in items:
+                self.fitness_cache.store(schedule, score)
+        return items
+
+    def update_best(self, items):
+        for item in items:
+            if self.best is None or item[1] > self.best[1]:
+                self.best = item
+
+    def elite_items(self, count):
+        return sorted(self.population, key=lambda item: item[1], reverse=True)[:count]
+
+    def accept_migrants(self, migrants):
+        if not migrants:
+            return
+        keep = max(len(self.population) - len(migrants), 0)
+        self.population = self.elite_items(keep) + list(migrants)
+        self.update_best(migrants)
+
+    def construction_budget_exhausted(self, built):
+        return built > 0 and self.time_budget is not None and self.elapsed() > self.time_budget
+
+    def initial_population(self, parallel_population):
+        population = list(zip(self.elite, self.evaluate_all(self.elite)))
+        count = self.population_size - len(population)
+        if parallel_population is not None:
+            while count > 0 and not self.construction_budget_exhausted(len(population)):
+                batch = count if self.time_budget is None else min(count, parallel_population.workers)
+                self.evaluations += batch
+                population += self.remember(parallel_population.generate(batch))
+                count -= batch
+            return population
+        schedules = []
+        for _ in range(count):
+            if self.construction_budget_exhausted(len(population) + len(schedules)):
+                break
+            schedule = Schedule()
+            schedule.generate_schedule(
+                groups=self.groups, teachers=self.teachers, auditoriums=self.auditoriums,
+                week_quantity=self.week_quantity, problem_index=self.problem_index, mode=self.construction_mode,
+                balance_teacher_load=self.balance_teacher_load
+            )
+            if self.assign_rooms:
+                schedule = assign_auditoriums(schedule, self.auditoriums, self.groups, self.problem_index)
+            schedules.append(schedule)
+        return population + list(zip(schedules, self.evaluate_all(schedules)))
+
+    def budget_exhausted(self, last_generation_seconds):
+        if self.time_budget is not None and self.elapsed() + last_generation_seconds > self.time_budget:
+            return "time_budget"
+        if self.max_evaluations is not None and \
+                self.evaluations + self.population_size - self.survivor_count > self.max_evaluations:
+            return "max_evaluations"
+        return None
+
+    def operator_plan(self):
+        if self.operator_bandit is not None:
+            operator_plan = self.operator_bandit.plan()
+        else:
+            operator_plan = DEFAULT_OPERATOR_PLAN
+        if self.assign_rooms:
+            operator_plan = tuple(
+                operator for operator in operator_plan if operator != "mutate_auditoriums_by_size"
+            ) + ("assign_auditoriums",)
+        return operator_plan
+
+    def breed(self, survivors, parallel_population):
+        parent_pairs = []
+        for _ in range(self.population_size - len(survivors)):
+            if len(survivors) > 1:
+                parent1, parent2 = random.sample(range(len(survivors)), 2)
+            else:
+                parent1 = parent2 = 0
+            parent_pairs.append((survivors[parent1][0], survivors[parent2][0]))
+
+        bandit = self.operator_bandit
+        if parallel_population is not None:
+            self.evaluations += len(parent_pairs)
+            operator_plans = None
+            if bandit is not None or self.assign_rooms:
+                operator_plans = [self.operator_plan() for _ in parent_pairs]
+            operator_logs = [] if bandit is not None else None
+            with telemetry.timer("parallel_breed"):
+                children = parallel_population.breed(parent_pairs, operator_plans, operator_logs)
+            for operator_log in operator_logs or ():
+                bandit.record_log(operator_log)
+            return self.remember(children)
+
+        children = []
+        for schedule1, schedule2 in parent_pairs:
+            operator_log = [] if bandit is not None else None
+            children.append(crossover(schedule1, schedule2, self.groups, self.teachers, self.week_quantity,
+                                      self.auditoriums, problem_index=self.problem_index,
+                                      operator_plan=self.operator_plan(), operator_log=operator_log))
+            if operator_log is not None:
+                bandit.record_log(operator_log)
+        with telemetry.timer("fitness_soft"):
+            return list(zip(children, self.evaluate_all(children)))
+
+    def save_checkpoint(self, path=None):
+        path = path or self.checkpoint_path
+        parallel_rng_state = self.parallel_rng_state
+        if self.parallel_population is not None:
+            parallel_rng_state = self.parallel_population.rng.getstate()
+        save_checkpoint(
+            path, self.population, ScheduleEncoding.from_problem(self.groups, self.teachers, self.auditoriums),
+            signature=self.signature,
+            generation=self.generation,
+            evaluations=self.evaluations,
+            best=self.best,
+            rng_state=random.getstate(),
+            parallel_rng_state=parallel_rng_state,
+            state={
+                "num_iter_no_change": list(self.num_iter_no_change),
+                "generations_without_improvement": self.generations_without_improvement,
+                "last_rain_generation": self.last_rain_generation,
+                "operator_bandit": self.operator_bandit.state() if self.operator_bandit is not None else None,
+            },
+        )
+
+    def resume(self, path):
+        checkpoint = load_checkpoint(path)
+        if checkpoint["signature"] != self.signature:
+            raise ValueError(f"Checkpoint '{path}' was written for a different problem")
+        self.population = checkpoint["population"]
+        self.best = checkpoint["best"]
+        self.generation = checkpoint["generation"]
+        self.evaluations = checkpoint["evaluations"]
+        self.num_iter_no_change = tuple(checkpoint["state"]["num_iter_no_change"])
+        self.generations_without_improvement = checkpoint["state"]["generations_without_improvement"]
+        self.last_rain_generation = checkpoint["state"].get("last_rain_generation")
+        if self.operator_bandit is not None and checkpoint["state"].get("operator_bandit"):
+            self.operator_bandit.load_state(checkpoint["state"]["operator_bandit"])
+        self.parallel_rng_state = checkpoint["parallel_rng_state"]
+        random.setstate(checkpoint["rng_state"])
+
+    def warm_start(self, path, count=None):
+        checkpoint = load_checkpoint(path)
+        candidates = checkpoint["population"]
+        if checkpoint["best"] is not None:
+            candidates = [checkpoint["best"]] + candidates
+        candidates = sorted(candidates, key=lambda item: item[1], reverse=True)
+
+        count = min(count or self.survivor_count, self.population_size)
+        self.elite = []
+        seen = set()
+        for schedule, _ in candidates:
+            if len(self.elite) >= count:
+                break
+            fingerprint = schedule_fingerprint(schedule).tobytes()
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            self.elite.append(self.adapt_schedule(schedule))
+
+    def adapt_schedule(self, schedule):
+        problem_index = self.problem_index
+        adapted = Schedule()
+        reallocated = []
+        for lesson in schedule.lessons:
+            details = problem_index.details_by_group.get(lesson.group)
+            if (details is None or (lesson.subject, lesson.lesson_type) not in details
+                    or lesson.teacher not in problem_index.teachers_by_name
+                    or lesson.auditorium not in problem_index.auditoriums_by_number):
+                continue
+            teacher = problem_index.allocated_teacher(lesson.group, lesson.subject, lesson.lesson_type,
+                                                      lesson.subgroup)
+            if teacher is not None and teacher.name != lesson.teacher:
+                reallocated.append((lesson.replace(teacher=teacher.name), teacher))
+                continue
+            if adapted.check_hard_constraints(lesson):
+                adapted.add_lesson(lesson)
+
+        for lesson, teacher in reallocated:
+            if adapted.check_hard_constraints(lesson):
+                adapted.add_lesson(lesson)
+                continue
+            group = problem_index.groups_by_name[lesson.group]
+            subject = next(subject for subject in group.subjects if subject.name == lesson.subject)
+            adapted.place_lesson(teacher, lesson.lesson_type, subject, group, lesson.subgroup,
+                                 problem_index.auditoriums_for(group.students_count), problem_index)
+        return adapted
+
+    def run(self):
+        from parallel import ParallelPopulation
+
+        self.start_time = time.perf_counter()
+        self.stop_reason = None
+        resumed = bool(self.population)
+        if not resumed:
+            random.seed(self.seed)
+            self.evaluations = 0
+            self.generation = 0
+            self.best = None
+            self.num_iter_no_change = (None, 0)
+            self.generations_without_improvement = 0
+            self.last_rain_generation = None
+
+        parallel_population = None
+        if self.workers > 1:
+            parallel_population = ParallelPopulation(self.groups, self.teachers, self.auditoriums,
+                                                     self.week_quantity, self.workers, self.seed,
+                                                     self.construction_mode, self.balance_teacher_load,
+                                                     self.assign_rooms, self.problem_index.teacher_allocation)
+            if self.parallel_rng_state is not None:
+                parallel_population.rng.setstate(self.parallel_rng_state)
+        self.parallel_population = parallel_population
+        try:
+            if not resumed:
+                self.population = self.initial_population(parallel_population)
+                self.update_best(self.population)
+
+            last_generation_seconds = 0.0
+            for i in range(self.generation, self.max_generations):
+                self.stop_reason = self.budget_exhausted(last_generation_seconds)
+                if self.stop_reason:
+                    return
+                generation_start = time.perf_counter()
+                previous_best = self.best[1]
+                telemetry.start_generation()
+
+                duplicates_dropped = 0
+                if not self.keep_duplicates:
+                    unique_population = drop_duplicates(self.population)
+                    duplicates_dropped = len(self.population) - len(unique_population)
+                    self.population = unique_population
+
+                with telemetry.timer("group_schedules"):
+                    similarity = similarity_matrix(self.population, self.similarity_num_perm,
+                                                   self.exact_similarity_limit)
+                    clusters = group_schedules(self.population, similarity_threshold=self.similarity_threshold,
+                                               similarity=similarity)
+
+                with telemetry.timer("predator_approach"):
+                    clean_indices = predator_approach(self.population, clusters, retain_count=self.retain_count,
+                                                      return_indices=True)
+                population_size = len(self.population)
+
+                sorted_indices = sorted(clean_indices, key=lambda idx: self.population[idx][1], reverse=True)
+                sorted_indices = sorted_indices[:self.survivor_count]
+                sorted_items = [self.population[idx] for idx in sorted_indices]
+                similarity = similarity[np.ix_(sorted_indices, sorted_indices)]
+                self.population = sorted_items
+
+                half_num = len(sorted_items) // 4
+                if (sorted_items[-half_num][1] - sorted_items[half_num][1]) < self.stagnation_delta and (
+                        self.num_iter_no_change[0] == sorted_items[-half_num][1]
+                        or self.num_iter_no_change[0] is None):
+                    self.num_iter_no_change = (sorted_items[-half_num][1], self.num_iter_no_change[1] + 1)
+                    if self.verbose:
+                        print("The results change weakly")
+                else:
+                    self.num_iter_no_change = (sorted_items[-half_num][1], 0)
+
+                # Same matrix as the clustering: exact up to exact_similarity_limit schedules, MinHash above.
+                diversity = population_diversity(similarity)
+                if self.operator_bandit is not None:
+                    rain = diversity < self.min_diversity and (
+                            self.last_rain_generation is None or i - self.last_rain_generation >= self.rain_cooldown)
+                else:
+                    rain = self.num_iter_no_change[1] == self.rain_after
+                if rain:
+                    with telemetry.timer("rain_effect"):
+                        self.population = rain_effect(self.population, self.population_size, self.teachers,
+                                                      self.auditoriums, self.groups, self.week_quantity,
+                                                      change_num=self.rain_change_num,
+                                                      max_attempts=self.rain_max_attempts,
+                                                      max_loss=self.rain_max_loss, similarity=similarity,
+                                                      problem_index=self.problem_index)
+                    self.evaluations += len(self.population) - len(sorted_items)
+                    self.num_iter_no_change = (None, 0)
+                    self.last_rain_generation = i
+
+                if self.verbose:
+                    print()
+                    print(f"Best of iter {i}: ")
+                    for item in sorted_items:
+                        print(item[1])
+
+                children = self.breed(self.population, parallel_population)
+                self.population.extend(children)
+                self.update_best(self.population)
+
+                if telemetry.enabled:
+                    telemetry.end_generation(
+                        i,
+                        best_fitness=sorted_items[0][1],
+                        worst_survivor_fitness=sorted_items[-1][1],
+                        clusters=len(clusters),
+                        schedules_dropped_by_predator=population_size - len(clean_indices),
+                        mean_survivor_similarity=1.0 - diversity if len(similarity) > 1 else 0.0,
+                        population=len(self.population),
+                        evaluations=self.evaluations,
+                        duplicates_dropped=duplicates_dropped,
+                        **({"fitness_cache": self.fitness_cache.stats()} if self.fitness_cache is not None else {}),
+                        **({"operators": self.operator_bandit.summary()} if self.operator_bandit is not None else {}),
+                    )
+
+                if self.best[1] - previous_best > self.min_improvement:
+                    self.generations_without_improvement = 0
+                else:
+                    self.generations_without_improvement += 1
+
+                last_generation_seconds = time.perf_counter() - generation_start
+                self.generation = i + 1
+                if self.checkpoint_path and self.generation % self.checkpoint_every == 0:
+                    self.save_checkpoint()
+                yield i, self.best[0], self.best[1]
+
+                if self.patience is not None and self.generations_without_improvement >= self.patience:
+                    self.stop_reason = "converged"
+                    return
+            self.stop_reason = "max_generations"
+        finally:
+            if self.checkpoint_path and self.population:
+                self.save_checkpoint()
+            if parallel_population is not None:
+                self.parallel_rng_state = parallel_population.rng.getstate()
+                parallel_population.close()
+            self.parallel_population = None
+
+    def solve(self):
+        for _ in self.run():
+            pass
+        return self.best
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Genetic schedule solver")
+    parser.add_argument("input", nargs="?", default="schedule_data.xlsx",
+                        help="an .xlsx workbook, a .json file or a directory of Groups/Teachers/Auditoriums .csv files")
+    parser.add_argument("--cache-dir", help="cache parsed input here, keyed by the input's content hash")
+    parser.add_argument("--output", default="schedule.xlsx",
+                        help="an .xlsx, .jsonl or .parquet file, or a directory of .csv files")
+    parser.add_argument("--output-format", choices=EXPORT_FORMATS)
+    parser.add_argument("--generate", type=int, nargs=4, metavar=("GROUPS", "TEACHERS", "AUDITORIUMS", "SUBJECTS"),
+                        help="add randomly generated test data to the input")
+    parser.add_argument("--week-quantity", type=int, default=14)
+    parser.add_argument("--population", type=int, default=100)
+    parser.add_argument("--generations", type=int, default=400)
+    parser.add_argument("--survivor-ratio", type=float, default=0.5)
+    parser.add_argument("--retain-ratio", type=float, default=0.1)
+    parser.add_argument("--similarity-threshold", type=float, default=0.8)
+    parser.add_argument("--similarity-num-perm", type=int,
+                        help="estimate schedule similarity with this many MinHash permutations")
+    parser.add_argument("--exact-similarity-limit", type=int, default=SIMILARITY_EXACT_LIMIT,
+                        help="above this population size similarity is estimated with MinHash")
+    parser.add_argument("--rain-max-loss", type=float,
+                        help="rain rejects teacher/auditorium changes that lower fitness by more than this")
+    parser.add_argument("--time-budget", type=float, help="wall-clock budget in seconds")
+    parser.add_argument("--max-evaluations", type=int)
+    parser.add_argument("--patience", type=int, help="stop after this many generations without improvement")
+    parser.add_argument("--min-improvement", type=float, default=0.0)
+    parser.add_argument("--construction-mode", choices=("random", "enumerate"), default="random")
+    parser.add_argument("--balance-teacher-load", action="store_true",
+                        help="prefer teachers with spare hours when building schedules")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--telemetry-log")
+    parser.add_argument("--progress-every", type=int, default=0)
+    parser.add_argument("--checkpoint", help="write the population to this file while running")
+    parser.add_argument("--checkpoint-every", type=int, default=10)
+    parser.add_argument("--resume", help="continue the run saved in this checkpoint")
+    parser.add_argument("--warm-start", help="seed the population with the elite of this checkpoint")
+    parser.add_argument("--warm-start-count", type=int)
+    parser.add_argument("--solver", choices=("genetic", "annealing"), default="genetic")
+    parser.add_argument("--max-iterations", type=int, help="annealing solver iteration limit")
+    parser.add_argument("--initial-temperature", type=float, default=2.0)
+    parser.add_argument("--final-temperature", type=float, default=0.01)
+    parser.add_argument("--tabu-tenure", type=int, default=0,
+                        help="annealing solver: keep recently moved lessons fixed for this many moves")
+    parser.add_argument("--fitness-cache-size", type=int, default=10000,
+                        help="number of schedule scores to memoize, 0 disables the cache")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="do not drop identical schedules before clustering")
+    parser.add_argument("--batch-fitness", action="store_true",
+                        help="score each generation's new schedules together with vectorized NumPy operations")
+    parser.add_argument("--allocate-teachers", action="store_true",
+                        help="fix each course's teacher up front by max-flow against teacher hours")
+    parser.add_argument("--assign-rooms", action="store_true",
+                        help="give each child the auditoriums that minimise overflow and empty seats per slot")
+    parser.add_argument("--adaptive-operators", action="store_true",
+                        help="pick child operators by measured gain per CPU second and rain on low diversity")
+    parser.add_argument("--operator-steps", type=int, default=4, help="operators applied to each child")
+    parser.add_argument("--min-diversity", type=float, default=0.7,
+                        help="adaptive mode: rain when survivor diversity (1 - mean similarity, from the clustering "
+                             "similarity matrix) drops below this")
+    parser.add_argument("--rain-cooldown", type=int, default=3,
+                        help="adaptive mode: generations to wait between diversity injections")
+    parser.add_argument("--islands", type=int, default=1,
+                        help="run this many independent populations in separate processes")
+    parser.add_argument("--migration-interval", type=int, default=10)
+    parser.add_argument("--migrants", type=int, default=2)
+    args = parser.parse_args(argv)
+    if args.islands > 1 and (args.checkpoint or args.resume or args.warm_start):
+        parser.error("checkpoints are not supported together with --islands")
+    if args.solver == "annealing" and (args.islands > 1 or args.checkpoint or args.resume or args.warm_start):
+        parser.error("--islands and checkpoints are only supported by the genetic solver")
+
+    random.seed(args.seed)
+    if args.telemetry_log or args.progress_every:
+        telemetry.enable()
+        if args.telemetry_log:
+            telemetry.subscribe(JsonlLogger(args.telemetry_log))
+        if args.progress_every:
+            telemetry.subscribe(ProgressReporter(args.progress_every))
+
+    groups, teachers, auditoriums = load_data(args.input, args.cache_dir)
+    if args.generate:
+        _, gen_teachers, gen_groups, gen_auditoriums = test_generate(*args.generate)
+        groups = gen_groups + groups
+        teachers = gen_teachers + teachers
+        auditoriums = gen_auditoriums + auditoriums
+
+    settings = dict(
+        population_size=args.population,
+        max_generations=args.generations,
+        survivor_ratio=args.survivor_ratio,
+        retain_ratio=args.retain_ratio,
+        similarity_threshold=args.similarity_threshold,
+        similarity_num_perm=args.similarity_num_perm,
+        exact_similarity_limit=args.exact_similarity_limit,
+        rain_max_loss=args.rain_max_loss,
+        time_budget=args.time_budget,
+        max_evaluations=args.max_evaluations,
+        patience=args.patience,
+        min_improvement=args.min_improvement,
+        construction_mode=args.construction_mode,
+        balance_teacher_load=args.balance_teacher_load,
+        fitness_cache_size=args.fitness_cache_size,
+        keep_duplicates=args.keep_duplicates,
+        batch_fitness=args.batch_fitness,
+        adaptive_operators=args.adaptive_operators,
+        operator_steps=args.operator_steps,
+        min_diversity=args.min_diversity,
+        rain_cooldown=args.rain_cooldown,
+        assign_rooms=args.assign_rooms,
+        allocate_teachers=args.allocate_teachers,
+    )
+    if args.solver == "annealing":
+        from local_search import LocalSearchSolver
+
+        time_budget = args.time_budget
+        if time_budget is None and args.max_iterations is None:
+            time_budget = 60.0
+        scheduler = LocalSearchSolver(groups, teachers, auditoriums, args.week_quantity, time_budget=time_budget,
+                                      max_iterations=args.max_iterations,
+                                      initial_temperature=args.initial_temperature,
+                                      final_temperature=args.final_temperature, tabu_tenure=args.tabu_tenure,
+                                      construction_mode=args.construction_mode,
+                                      balance_teacher_load=args.balance_teacher_load,
+                                      allocate_teachers=args.allocate_teachers, seed=args.seed,
+                                      verbose=not args.progress_every)
+    elif args.islands > 1:
+        from islands import IslandModel
+
+        scheduler = IslandModel(groups, teachers, auditoriums, args.week_quantity, args.islands,
+                                args.migration_interval, args.migrants, seed=args.seed,
+                                verbose=not args.progress_every, **settings)
+    else:
+        scheduler = GeneticScheduler(groups, teachers, auditoriums, args.week_quantity, workers=args.workers,
+                                     seed=args.seed, verbose=not args.progress_every,
+                                     checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every,
+                                     **settings)
+    try:
+        if args.resume:
+            scheduler.resume(args.resume)
+        elif args.warm_start:
+            scheduler.warm_start(args.warm_start, args.warm_start_count)
+        best_schedule, _ = scheduler.solve()
+    except Exception as e:
+        print(f"{e}")
+        return 1
+
+    print()
+    if args.solver == "annealing":
+        print(f"Stopped after {scheduler.iteration} iterations, {scheduler.evaluations} evaluated moves, "
+              f"{scheduler.elapsed():.1f}s: {scheduler.stop_reason}")
+    else:
+        print(f"Stopped after {scheduler.generation} generations, {scheduler.evaluations} evaluations, "
+              f"{scheduler.elapsed():.1f}s: {scheduler.stop_reason}")
+    print("BEST:")
+    print("Hard constraints:", best_schedule.hard_constraints_schedule_check())
+    fitness_soft(best_schedule, groups, teachers, auditoriums, args.week_quantity, True, scheduler.problem_index)
+    export_schedule(best_schedule, groups, auditoriums, args.output, args.output_format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
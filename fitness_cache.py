@@ -0,0 +1,102 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from main import ProblemIndex, components_score, fitness_components
+
+
+def schedule_key(schedule):
+    def build(schedule):
+        lesson_hashes = np.sort(np.fromiter(
+            (hash(lesson.values()) for lesson in schedule.lessons), dtype=np.int64, count=len(schedule.lessons)
+        ))
+        return hashlib.blake2b(lesson_hashes.tobytes(), digest_size=16).digest()
+
+    return schedule.cached("schedule_key", build)
+
+
+def drop_duplicates(schedules_collection):
+    seen = set()
+    unique = []
+    for item in schedules_collection:
+        key = schedule_key(item[0])
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+class FitnessCache:
+    def __init__(self, groups, teachers, auditoriums, week_quantity, maxsize=10000, problem_index=None):
+        if problem_index is None:
+            problem_index = ProblemIndex(groups, teachers, auditoriums)
+        self.groups = groups
+        self.teachers = teachers
+        self.auditoriums = auditoriums
+        self.week_quantity = week_quantity
+        self.problem_index = problem_index
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+            "hit_rate": self.hit_rate,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, schedule):
+        key = schedule_key(schedule)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, schedule, score, components=None):
+        key = schedule_key(schedule)
+        self.entries[key] = (score, components)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def compute(self, schedule):
+        components = fitness_components(schedule, self.groups, self.teachers, self.auditoriums, self.week_quantity,
+                                        self.problem_index)
+        entry = (components_score(components), components)
+        self.store(schedule, *entry)
+        return entry
+
+    def evaluate_components(self, schedule):
+        entry = self.lookup(schedule)
+        if entry is None or entry[1] is None:
+            entry = self.compute(schedule)
+        return entry
+
+    def evaluate(self, schedule):
+        entry = self.lookup(schedule)
+        if entry is None:
+            entry = self.compute(schedule)
+        return entry[0]
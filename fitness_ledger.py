@@ -0,0 +1,155 @@
+import copy
+from collections import Counter, defaultdict
+
+from classes import ProblemIndex
+
+
+class FitnessLedger:
+    COMPONENTS = (
+        "window_group_penalty",
+        "window_teacher_penalty",
+        "capacity_penalty",
+        "weekly_hours_penalty",
+        "overlearning_time_penalty",
+    )
+
+    def __init__(self, groups, teachers, auditoriums, week_quantity, problem_index=None):
+        if problem_index is None:
+            problem_index = ProblemIndex(groups, teachers, auditoriums)
+        self.week_quantity = week_quantity
+        self.group_weight = Counter(group.name for group in groups)
+        self.teacher_weight = Counter(teacher.name for teacher in teachers)
+        self.students_by_group = problem_index.students_by_group
+        self.details_by_group = problem_index.details_by_group
+        self.teacher_hours = defaultdict(list)
+        for teacher in teachers:
+            self.teacher_hours[teacher.name].append(teacher.hours)
+        self.capacity_by_auditorium = problem_index.capacity_by_auditorium
+
+        self.group_day_slots = defaultdict(Counter)
+        self.teacher_day_slots = defaultdict(Counter)
+        self.teacher_slots = defaultdict(Counter)
+        self.auditorium_students = Counter()
+        self.subject_counts = Counter()
+        self.components = dict.fromkeys(self.COMPONENTS, 0)
+
+    @classmethod
+    def from_schedule(cls, schedule, groups, teachers, auditoriums, week_quantity, problem_index=None):
+        ledger = cls(groups, teachers, auditoriums, week_quantity, problem_index)
+        ledger.apply_move(added=schedule.lessons)
+        return ledger
+
+    def copy(self):
+        ledger = copy.copy(self)
+        ledger.group_day_slots = defaultdict(Counter, {key: Counter(value) for key, value in self.group_day_slots.items()})
+        ledger.teacher_day_slots = defaultdict(
+            Counter, {key: Counter(value) for key, value in self.teacher_day_slots.items()}
+        )
+        ledger.teacher_slots = defaultdict(Counter, {key: Counter(value) for key, value in self.teacher_slots.items()})
+        ledger.auditorium_students = Counter(self.auditorium_students)
+        ledger.subject_counts = Counter(self.subject_counts)
+        ledger.components = dict(self.components)
+        return ledger
+
+    @property
+    def score(self):
+        return -sum(self.components.values())
+
+    def add_lesson(self, lesson):
+        self.apply_move(added=(lesson,))
+
+    def remove_lesson(self, lesson):
+        self.apply_move(removed=(lesson,))
+
+    def move_delta(self, removed=(), added=()):
+        keys = self._affected_keys(removed, added)
+        before = self._penalties(keys)
+        self._update(removed, added)
+        after = self._penalties(keys)
+        self._update(added, removed)
+        return sum(before.values()) - sum(after.values())
+
+    def apply_move(self, removed=(), added=()):
+        keys = self._affected_keys(removed, added)
+        before = self._penalties(keys)
+        self._update(removed, added)
+        after = self._penalties(keys)
+        for component in self.COMPONENTS:
+            self.components[component] += after[component] - before[component]
+        return sum(before.values()) - sum(after.values())
+
+    def _update(self, removed, added):
+        for lesson in removed:
+            self._count(lesson, -1)
+        for lesson in added:
+            self._count(lesson, 1)
+
+    def _count(self, lesson, sign):
+        slot = (lesson.day, lesson.lesson_num)
+        self._bump(self.group_day_slots[(lesson.group, lesson.day)], lesson.lesson_num, sign)
+        self._bump(self.teacher_day_slots[(lesson.teacher, lesson.day)], lesson.lesson_num, sign)
+        self._bump(self.teacher_slots[lesson.teacher], slot, sign)
+        self._bump(self.auditorium_students, (lesson.auditorium,) + slot,
+                   sign * self.students_by_group[lesson.group])
+        self._bump(self.subject_counts, (lesson.group, lesson.subject, lesson.lesson_type), sign)
+
+    @staticmethod
+    def _bump(counter, key, amount):
+        value = counter[key] + amount
+        if value:
+            counter[key] = value
+        else:
+            counter.pop(key, None)
+
+    @staticmethod
+    def _affected_keys(removed, added):
+        keys = set()
+        for lessons in (removed, added):
+            for lesson in lessons:
+                keys.add(("group_day", lesson.group, lesson.day))
+                keys.add(("teacher_day", lesson.teacher, lesson.day))
+                keys.add(("teacher", lesson.teacher))
+                keys.add(("auditorium", lesson.auditorium, lesson.day, lesson.lesson_num))
+                keys.add(("subject", lesson.group, lesson.subject, lesson.lesson_type))
+        return keys
+
+    def _penalties(self, keys):
+        penalties = dict.fromkeys(self.COMPONENTS, 0)
+        for key in keys:
+            kind = key[0]
+            if kind == "group_day":
+                penalties["window_group_penalty"] += self.group_weight[key[1]] * self._windows(
+                    self.group_day_slots.get(key[1:]))
+            elif kind == "teacher_day":
+                penalties["window_teacher_penalty"] += self.teacher_weight[key[1]] * self._windows(
+                    self.teacher_day_slots.get(key[1:]))
+            elif kind == "teacher":
+                total_hours = len(self.teacher_slots.get(key[1], ())) * 1.5
+                for hours in self.teacher_hours.get(key[1], ()):
+                    if total_hours > hours:
+                        penalties["weekly_hours_penalty"] += total_hours - hours
+            elif kind == "auditorium":
+                total_students = self.auditorium_students.get(key[1:], 0)
+                capacity = self.capacity_by_auditorium[key[1]]
+                if total_students > capacity:
+                    penalties["capacity_penalty"] += total_students - capacity
+            else:
+                count = self.subject_counts.get(key[1:], 0)
+                if count:
+                    detail = self.details_by_group[key[1]][key[2:]]
+                    subgroups_count = detail.subgroups or 1
+                    subject_time = abs((count * 1.5 * self.week_quantity) / subgroups_count - detail.hours)
+                    penalties["overlearning_time_penalty"] += \
+                        self.group_weight[key[1]] * subject_time / self.week_quantity
+        return penalties
+
+    @staticmethod
+    def _windows(slots):
+        if not slots:
+            return 0
+        lesson_nums = sorted(slots)
+        windows = 0
+        for i in range(len(lesson_nums) - 1):
+            if (lesson_nums[i + 1] - lesson_nums[i]) > 1:
+                windows += 1
+        return windows
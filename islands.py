@@ -0,0 +1,148 @@
+import multiprocessing
+import random
+import time
+
+from compact import CompactSchedule, ScheduleEncoding
+from engine import GeneticScheduler
+from main import ProblemIndex
+
+
+def encode_items(items, encoding):
+    return [(CompactSchedule.from_schedule(schedule, encoding).arrays, score) for schedule, score in items]
+
+
+def decode_items(items, encoding):
+    return [(CompactSchedule(encoding, arrays).to_schedule(), score) for arrays, score in items]
+
+
+def _island_worker(conn, groups, teachers, auditoriums, week_quantity, settings, seed, migration_interval,
+                   migrants):
+    try:
+        encoding = ScheduleEncoding.from_problem(groups, teachers, auditoriums)
+        scheduler = GeneticScheduler(groups, teachers, auditoriums, week_quantity, seed=seed, **settings)
+        for _, _, _ in scheduler.run():
+            if scheduler.generation % migration_interval != 0:
+                continue
+            conn.send(("migrate", encode_items(scheduler.elite_items(migrants), encoding), scheduler.best[1],
+                       scheduler.evaluations))
+            command, incoming = conn.recv()
+            if command == "stop":
+                break
+            scheduler.accept_migrants(decode_items(incoming, encoding))
+        conn.send(("done", encode_items([scheduler.best], encoding), scheduler.generation,
+                   scheduler.evaluations, scheduler.stop_reason))
+    except Exception as e:
+        conn.send(("error", f"{e}"))
+    finally:
+        conn.close()
+
+
+class IslandModel:
+    def __init__(self, groups, teachers, auditoriums, week_quantity=14, islands=4, migration_interval=10,
+                 migrants=2, seed=None, verbose=False, **settings):
+        self.groups = groups
+        self.teachers = teachers
+        self.auditoriums = auditoriums
+        self.week_quantity = week_quantity
+        self.islands = islands
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.seed = seed
+        self.verbose = verbose
+        self.settings = settings
+        self.problem_index = ProblemIndex(groups, teachers, auditoriums)
+        self.encoding = ScheduleEncoding.from_problem(groups, teachers, auditoriums)
+
+        self.best = None
+        self.generation = 0
+        self.evaluations = 0
+        self.stop_reason = None
+        self.start_time = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def update_best(self, items):
+        for item in items:
+            if self.best is None or item[1] > self.best[1]:
+                self.best = item
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        self.best = None
+        self.generation = 0
+        self.stop_reason = None
+
+        rng = random.Random(self.seed)
+        island_seeds = [rng.getrandbits(32) for _ in range(self.islands)]
+        context = multiprocessing.get_context()
+        connections = []
+        processes = []
+        for island_seed in island_seeds:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_island_worker,
+                args=(child_conn, self.groups, self.teachers, self.auditoriums, self.week_quantity,
+                      self.settings, island_seed, self.migration_interval, self.migrants),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            connections.append(parent_conn)
+            processes.append(process)
+
+        alive = list(range(self.islands))
+        evaluations = [0] * self.islands
+        stop_reasons = []
+        try:
+            while alive:
+                emigrants = {}
+                island_bests = {}
+                for island in list(alive):
+                    message = connections[island].recv()
+                    if message[0] == "error":
+                        raise Exception(f"Island {island}: {message[1]}")
+                    if message[0] == "done":
+                        _, best, generation, evaluations[island], stop_reason = message
+                        self.update_best(decode_items(best, self.encoding))
+                        self.generation = max(self.generation, generation)
+                        stop_reasons.append(stop_reason)
+                        alive.remove(island)
+                        continue
+                    _, emigrants[island], island_bests[island], evaluations[island] = message
+
+                self.evaluations = sum(evaluations)
+                if not emigrants:
+                    break
+
+                migrating = [island for island in alive if island in emigrants]
+                for position, island in enumerate(migrating):
+                    source = migrating[position - 1]
+                    incoming = emigrants[source] if source != island else []
+                    connections[island].send(("migrate", incoming))
+                    self.update_best(decode_items(emigrants[island][:1], self.encoding))
+
+                self.generation += self.migration_interval
+                if self.verbose:
+                    print(f"Migration after generation {self.generation}: island bests "
+                          f"{[island_bests[island] for island in migrating]}")
+                yield self.generation, self.best[0], self.best[1]
+        finally:
+            for island in alive:
+                try:
+                    connections[island].send(("stop", None))
+                except (BrokenPipeError, OSError):
+                    pass
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            for conn in connections:
+                conn.close()
+
+        self.stop_reason = max(set(stop_reasons), key=stop_reasons.count) if stop_reasons else "stopped"
+
+    def solve(self):
+        for _ in self.run():
+            pass
+        return self.best
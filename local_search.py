@@ -0,0 +1,263 @@
+import math
+import random
+import time
+from collections import Counter, deque
+
+from allocation import teacher_allocation
+from main import *
+
+MOVES = ("move", "swap", "teacher", "auditorium")
+
+
+class LocalSearchSolver:
+    def __init__(self, groups, teachers, auditoriums, week_quantity=14, time_budget=60.0, max_iterations=None,
+                 initial_temperature=2.0, final_temperature=0.01, tabu_tenure=0, move_weights=None,
+                 max_lessons_per_day=4, construction_mode="random", balance_teacher_load=False,
+                 allocate_teachers=False, seed=None, verbose=False, report_every=1000):
+        self.groups = groups
+        self.teachers = teachers
+        self.auditoriums = auditoriums
+        self.week_quantity = week_quantity
+        self.time_budget = time_budget
+        self.max_iterations = max_iterations
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+        self.tabu_tenure = tabu_tenure
+        self.move_weights = move_weights or dict.fromkeys(MOVES, 1)
+        self.max_lessons_per_day = max_lessons_per_day
+        self.construction_mode = construction_mode
+        self.balance_teacher_load = balance_teacher_load
+        self.seed = seed
+        self.verbose = verbose
+        self.report_every = report_every
+        self.problem_index = ProblemIndex(groups, teachers, auditoriums)
+        if allocate_teachers:
+            self.problem_index.teacher_allocation = teacher_allocation(groups, teachers, week_quantity,
+                                                                       self.problem_index)
+
+        self.schedule = None
+        self.best = None
+        self.iteration = 0
+        self.evaluations = 0
+        self.accepted_moves = Counter()
+        self.stop_reason = None
+        self.start_time = None
+        self.tabu = deque()
+        self.tabu_keys = Counter()
+        self.course_lessons = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def progress(self):
+        fractions = []
+        if self.time_budget:
+            fractions.append(self.elapsed() / self.time_budget)
+        if self.max_iterations:
+            fractions.append(self.iteration / self.max_iterations)
+        return min(max(fractions), 1.0)
+
+    def temperature(self):
+        ratio = self.final_temperature / self.initial_temperature
+        return self.initial_temperature * ratio ** self.progress()
+
+    @staticmethod
+    def course_key(lesson):
+        return lesson.group, lesson.subject, lesson.lesson_type, lesson.subgroup
+
+    @staticmethod
+    def teacher_course_key(lesson):
+        return lesson.group, lesson.subject, lesson.lesson_type, lesson.subgroup, lesson.teacher
+
+    def index_lessons(self, removed, added):
+        for lesson in removed:
+            key = self.teacher_course_key(lesson)
+            course = self.course_lessons[key]
+            del course[lesson]
+            if not course:
+                del self.course_lessons[key]
+        for lesson in added:
+            self.course_lessons.setdefault(self.teacher_course_key(lesson), {})[lesson] = None
+
+    def is_tabu(self, lessons):
+        return any(self.tabu_keys[self.course_key(lesson)] for lesson in lessons)
+
+    def make_tabu(self, lessons):
+        if not self.tabu_tenure:
+            return
+        for lesson in lessons:
+            key = self.course_key(lesson)
+            self.tabu.append(key)
+            self.tabu_keys[key] += 1
+        while len(self.tabu) > self.tabu_tenure:
+            self.tabu_keys[self.tabu.popleft()] -= 1
+
+    def random_slot(self):
+        return random.choice(list(Day)), random.randint(1, self.max_lessons_per_day)
+
+    def lesson_bundle(self, lesson):
+        return self.schedule.teacher_slots.get((lesson.teacher, lesson.day, lesson.lesson_num), (lesson,))
+
+    def propose_move(self, move):
+        lessons = self.schedule.lessons
+        lesson = random.choice(lessons)
+        if move == "move":
+            day, lesson_num = self.random_slot()
+            if (day, lesson_num) == (lesson.day, lesson.lesson_num):
+                return None
+            bundle = self.lesson_bundle(lesson)
+            return bundle, tuple(
+                bundle_lesson.replace(day=day, lesson_num=lesson_num) for bundle_lesson in bundle
+            )
+        if move == "swap":
+            other = random.choice(lessons)
+            if (other.day, other.lesson_num) == (lesson.day, lesson.lesson_num):
+                return None
+            bundle = self.lesson_bundle(lesson)
+            other_bundle = self.lesson_bundle(other)
+            return bundle + other_bundle, tuple(
+                bundle_lesson.replace(day=other.day, lesson_num=other.lesson_num) for bundle_lesson in bundle
+            ) + tuple(
+                bundle_lesson.replace(day=lesson.day, lesson_num=lesson.lesson_num) for bundle_lesson in other_bundle
+            )
+        if move == "teacher":
+            eligible_teachers = [
+                teacher for teacher in self.problem_index.course_teachers(lesson.group, lesson.subject,
+                                                                          lesson.lesson_type, lesson.subgroup)
+                if teacher.name != lesson.teacher
+            ]
+            if not eligible_teachers:
+                return None
+            new_teacher = random.choice(eligible_teachers).name
+            course_lessons = tuple(self.course_lessons[self.teacher_course_key(lesson)])
+            return course_lessons, tuple(
+                existing_lesson.replace(teacher=new_teacher) for existing_lesson in course_lessons
+            )
+        bundle = self.lesson_bundle(lesson)
+        students_by_group = self.problem_index.students_by_group
+        eligible_auditoriums = self.problem_index.auditoriums_for(
+            sum(students_by_group.get(bundle_lesson.group, 0) for bundle_lesson in bundle), strict=True
+        )
+        eligible_auditoriums = [
+            auditorium for auditorium in eligible_auditoriums if auditorium.number != lesson.auditorium
+        ]
+        if not eligible_auditoriums:
+            return None
+        new_auditorium = random.choice(eligible_auditoriums).number
+        return bundle, tuple(bundle_lesson.replace(auditorium=new_auditorium) for bundle_lesson in bundle)
+
+    def apply(self, removed, added):
+        schedule = self.schedule
+        ledger = schedule.ledger
+        schedule.ledger = None
+        try:
+            for lesson in removed:
+                schedule.remove_lesson(lesson)
+            placed = []
+            for lesson in added:
+                if not schedule.check_hard_constraints(lesson):
+                    for placed_lesson in placed:
+                        schedule.remove_lesson(placed_lesson)
+                    for removed_lesson in removed:
+                        schedule.add_lesson(removed_lesson)
+                    return None
+                schedule.add_lesson(lesson)
+                placed.append(lesson)
+        finally:
+            schedule.ledger = ledger
+        self.index_lessons(removed, added)
+        return ledger.apply_move(removed, added)
+
+    def rollback(self, removed, added):
+        schedule = self.schedule
+        ledger = schedule.ledger
+        schedule.ledger = None
+        for lesson in added:
+            schedule.remove_lesson(lesson)
+        for lesson in removed:
+            schedule.add_lesson(lesson)
+        schedule.ledger = ledger
+        self.index_lessons(added, removed)
+        ledger.apply_move(added, removed)
+
+    def accept(self, delta, temperature):
+        if delta >= 0:
+            return True
+        return random.random() < math.exp(delta / temperature)
+
+    def step(self):
+        move = random.choices(list(self.move_weights), weights=list(self.move_weights.values()))[0]
+        proposal = self.propose_move(move)
+        if proposal is None:
+            return
+        removed, added = proposal
+        delta = self.apply(removed, added)
+        if delta is None:
+            return
+        self.evaluations += 1
+        new_score = self.schedule.ledger.score
+        aspiration = new_score > self.best[1]
+        if (self.tabu_tenure and self.is_tabu(removed) and not aspiration) or \
+                not self.accept(delta, self.temperature()):
+            self.rollback(removed, added)
+            return
+        self.make_tabu(added)
+        self.accepted_moves[move] += 1
+        if aspiration:
+            self.best = (list(self.schedule.lessons), new_score)
+
+    def budget_exhausted(self):
+        if self.time_budget is not None and self.elapsed() >= self.time_budget:
+            return "time_budget"
+        if self.max_iterations is not None and self.iteration >= self.max_iterations:
+            return "max_iterations"
+        return None
+
+    def best_schedule(self):
+        schedule = Schedule()
+        for lesson in self.best[0]:
+            schedule.add_lesson(lesson)
+        return schedule
+
+    def run(self, schedule=None):
+        if self.time_budget is None and self.max_iterations is None:
+            raise ValueError("LocalSearchSolver needs a time_budget or max_iterations")
+        random.seed(self.seed)
+        self.start_time = time.perf_counter()
+        self.iteration = 0
+        self.evaluations = 0
+        self.accepted_moves = Counter()
+        self.tabu = deque()
+        self.tabu_keys = Counter()
+
+        if schedule is None:
+            schedule = Schedule()
+            schedule.generate_schedule(self.groups, self.teachers, self.auditoriums, self.week_quantity,
+                                       self.problem_index, mode=self.construction_mode,
+                                       balance_teacher_load=self.balance_teacher_load)
+        self.schedule = schedule.clone()
+        self.schedule.ledger = FitnessLedger.from_schedule(self.schedule, self.groups, self.teachers,
+                                                           self.auditoriums, self.week_quantity, self.problem_index)
+        self.best = (list(self.schedule.lessons), self.schedule.ledger.score)
+        self.course_lessons = {}
+        self.index_lessons((), self.schedule.lessons)
+
+        while True:
+            self.stop_reason = self.budget_exhausted()
+            if self.stop_reason:
+                break
+            if self.schedule.lessons:
+                self.step()
+            self.iteration += 1
+            if self.iteration % self.report_every == 0:
+                if self.verbose:
+                    print(f"Iter {self.iteration}: current {self.schedule.ledger.score:.2f}, "
+                          f"best {self.best[1]:.2f}, temperature {self.temperature():.3f}")
+                yield self.iteration, self.best[1]
+
+        self.schedule.ledger = None
+
+    def solve(self, schedule=None):
+        for _ in self.run(schedule):
+            pass
+        return self.best_schedule(), self.best[1]
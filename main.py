@@ -1,177 +1,250 @@
+import time
+from collections import Counter
 from math import floor, ceil
 from random import choice, randint
 
+import numpy as np
+
 from data_workers import *
-import copy
+from fitness_ledger import FitnessLedger
+from telemetry import telemetry
+
 
+def fitness_soft(schedule, groups, teachers, auditoriums, week_quantity, output=False, problem_index=None):
+    components = fitness_components(schedule, groups, teachers, auditoriums, week_quantity, problem_index)
+    score = components_score(components)
 
-def fitness_soft(schedule, groups, teachers, auditoriums, week_quantity, output=False):
+    if output:
+        print("Groups windows:", -components["window_group_penalty"])
+        print("Teachers windows:", -components["window_teacher_penalty"])
+        print("Auditoriums capacity:", -components["capacity_penalty"])
+        print("Teachers hours constraints:", -components["weekly_hours_penalty"])
+        print("Groups hours overlearning/underlearning:", -components["overlearning_time_penalty"])
+        print("Final score: ", score)
+        print()
+    return score
+
+
+def components_score(components):
     score = 0
+    for component in FitnessLedger.COMPONENTS:
+        score -= components[component]
+    return score
+
+
+def fitness_components(schedule, groups, teachers, auditoriums, week_quantity, problem_index=None):
+    if problem_index is None:
+        problem_index = ProblemIndex(groups, teachers, auditoriums)
+
+    students_by_group = problem_index.students_by_group
+    capacity_by_auditorium = problem_index.capacity_by_auditorium
+
+    group_day_slots = defaultdict(list)
+    teacher_day_slots = defaultdict(list)
+    students_by_auditorium_time = defaultdict(lambda: defaultdict(int))
+    subject_counts_by_group = defaultdict(dict)
+    for lesson in schedule.lessons:
+        group_day_slots[(lesson.group, lesson.day)].append(lesson.lesson_num)
+        teacher_day_slots[(lesson.teacher, lesson.day)].append(lesson.lesson_num)
+        students_by_auditorium_time[lesson.auditorium][(lesson.day, lesson.lesson_num)] += \
+            students_by_group[lesson.group]
+        subject_counts = subject_counts_by_group[lesson.group]
+        key = (lesson.subject, lesson.lesson_type)
+        subject_counts[key] = subject_counts.get(key, 0) + 1
 
     window_group_penalty = 0
     for group in groups:
         for day in Day:
-            day_lessons = sorted(
-                [lesson for lesson in schedule.lessons if
-                 lesson.group == group.name and lesson.day == day],
-                key=lambda x: x.lesson_num
-            )
-            for i in range(len(day_lessons) - 1):
-                if (day_lessons[i + 1].lesson_num - day_lessons[i].lesson_num) > 1:
-                    window_group_penalty += 1
-    score -= window_group_penalty
+            window_group_penalty += count_windows(group_day_slots.get((group.name, day)))
 
     window_teacher_penalty = 0
     for teacher in teachers:
         for day in Day:
-            day_lessons = sorted(
-                [lesson for lesson in schedule.lessons if
-                 lesson.teacher == teacher.name and lesson.day == day],
-                key=lambda x: x.lesson_num
-            )
-            for i in range(len(day_lessons) - 1):
-                if (day_lessons[i + 1].lesson_num - day_lessons[i].lesson_num) > 1:
-                    window_teacher_penalty += 1
-    score -= window_teacher_penalty
+            window_teacher_penalty += count_windows(teacher_day_slots.get((teacher.name, day)))
 
     capacity_penalty = 0
-    lessons_by_auditorium_time = defaultdict(lambda: defaultdict(list))
-    for lesson in schedule.lessons:
-        lessons_by_auditorium_time[lesson.auditorium][(lesson.day, lesson.lesson_num)].append(lesson)
-
-    for auditorium_num, lessons_by_day in lessons_by_auditorium_time.items():
-        for (day, lesson_num), lessons in lessons_by_day.items():
-            total_students = sum(next(g.students_count for g in groups if g.name == lesson.group) for lesson in lessons)
-            auditorium = next(a for a in auditoriums if a.number == auditorium_num)
-
-            if total_students > auditorium.capacity:
-                capacity_penalty = total_students - auditorium.capacity
-    score -= capacity_penalty
+    for auditorium_num, students_by_time in students_by_auditorium_time.items():
+        capacity = capacity_by_auditorium[auditorium_num]
+        for total_students in students_by_time.values():
+            if total_students > capacity:
+                capacity_penalty += total_students - capacity
 
     weekly_hours_penalty = 0
     for teacher in teachers:
-        teacher_lessons = sorted(
-            [lesson for lesson in schedule.lessons if lesson.teacher == teacher.name],
-            key=lambda x: (x.day, x.lesson_num)
-        )
-        unique_slots = set()
-        for lesson in teacher_lessons:
-            unique_slots.add((lesson.day, lesson.lesson_num))
-        total_hours = len(unique_slots) * 1.5
+        total_hours = schedule.teacher_hours(teacher.name)
         if total_hours > teacher.hours:
             weekly_hours_penalty += total_hours - teacher.hours
-    score -= weekly_hours_penalty
 
     overlearning_time_penalty = 0
     for group in groups:
-        subject_dict = {}
-        for lesson in schedule.lessons:
-            if lesson.group == group.name:
-                name = str(lesson.subject + "-" + lesson.lesson_type)
-                if not name in subject_dict:
-                    subject_dict[name] = 1
-                else:
-                    subject_dict[name] += 1
-        for subject_item in subject_dict:
-            split_array = subject_item.split("-")
-            subj_name = split_array[0]
-            subj_type = split_array[1]
-            result_detail = next(
-                (detail for subject in group.subjects if subject.name == subj_name
-                 for detail in subject.details if detail.type == subj_type),
-                None
-            )
+        subject_counts = subject_counts_by_group.get(group.name)
+        if not subject_counts:
+            continue
+        details_by_key = problem_index.details_by_group[group.name]
+        for key, count in subject_counts.items():
+            result_detail = details_by_key.get(key)
             subgroups_count = result_detail.subgroups
             if not subgroups_count:
                 subgroups_count = 1
-            subject_time = abs(
-                (subject_dict[subject_item] * 1.5 * week_quantity) / subgroups_count - result_detail.hours)
+            subject_time = abs((count * 1.5 * week_quantity) / subgroups_count - result_detail.hours)
             overlearning_time_penalty += subject_time
     overlearning_time_penalty /= week_quantity
-    score -= overlearning_time_penalty
 
-    if output:
-        print("Groups windows:", -window_group_penalty)
-        print("Teachers windows:", -window_teacher_penalty)
-        print("Auditoriums capacity:", -capacity_penalty)
-        print("Teachers hours constraints:", -weekly_hours_penalty)
-        print("Groups hours overlearning/underlearning:", -overlearning_time_penalty)
-        print("Final score: ", score)
-        print()
-    return score
+    return {
+        "window_group_penalty": window_group_penalty,
+        "window_teacher_penalty": window_teacher_penalty,
+        "capacity_penalty": capacity_penalty,
+        "weekly_hours_penalty": weekly_hours_penalty,
+        "overlearning_time_penalty": overlearning_time_penalty,
+    }
+
+
+def count_windows(lesson_nums):
+    if not lesson_nums:
+        return 0
+    lesson_nums = sorted(lesson_nums)
+    windows = 0
+    for i in range(len(lesson_nums) - 1):
+        if (lesson_nums[i + 1] - lesson_nums[i]) > 1:
+            windows += 1
+    return windows
+
+
+CHILD_OPERATORS = ("mutation_fixed_group_subjects", "smoothing", "mutate_auditoriums_by_size")
+DEFAULT_OPERATOR_PLAN = (
+    "mutation_fixed_group_subjects",
+    "smoothing",
+    "mutation_fixed_group_subjects",
+    "mutate_auditoriums_by_size",
+)
+
+
+def crossover(schedule1, schedule2, groups, teachers, week_quantity, auditoriums, max_lessons_per_day=4,
+              problem_index=None, operator_plan=DEFAULT_OPERATOR_PLAN, operator_log=None):
+    if problem_index is None:
+        problem_index = ProblemIndex(groups, teachers, auditoriums)
+    new_schedule = recombine(schedule1, schedule2, groups, max_lessons_per_day)
+
+    score = None
+    if operator_log is not None:
+        score = fitness_soft(new_schedule, groups, teachers, auditoriums, week_quantity, False, problem_index)
+    for operator in operator_plan:
+        start = time.process_time()
+        with telemetry.timer(operator):
+            new_schedule = apply_child_operator(operator, new_schedule, groups, teachers, auditoriums,
+                                                week_quantity, problem_index)
+        if operator_log is not None:
+            seconds = time.process_time() - start
+            new_score = fitness_soft(new_schedule, groups, teachers, auditoriums, week_quantity, False,
+                                     problem_index)
+            operator_log.append((operator, new_score - score, seconds))
+            score = new_score
+    return new_schedule
 
 
-def crossover(schedule1, schedule2, groups, teachers, week_quantity, auditoriums, max_lessons_per_day=4):
-    new_schedule = Schedule()
+def apply_child_operator(operator, schedule, groups, teachers, auditoriums, week_quantity, problem_index=None):
+    if operator == "mutation_fixed_group_subjects":
+        return mutation_fixed_group_subjects(schedule, groups, teachers, auditoriums, week_quantity, problem_index)
+    if operator == "smoothing":
+        return smoothing(schedule, teachers)
+    if operator == "mutate_auditoriums_by_size":
+        return mutate_auditoriums_by_size(schedule, auditoriums, groups, problem_index)
+    if operator == "assign_auditoriums":
+        return assign_auditoriums(schedule, auditoriums, groups, problem_index)
+    raise ValueError(f"Unknown operator '{operator}'")
 
-    for group in groups:
-        assigned_teachers = {}
 
-        for day in Day:
-            for lesson_num in range(1, max_lessons_per_day + 1):
-                parent_schedule = schedule1 if random.random() < 0.5 else schedule2
-                lesson = next(
-                    (l for l in parent_schedule.lessons
-                     if l.group == group.name and l.day == day and l.lesson_num == lesson_num),
-                    None
-                )
-
-                if lesson:
-                    subject = lesson.subject
-                    lesson_type = lesson.lesson_type
-
-                    if (subject, lesson_type) not in assigned_teachers:
-                        assigned_teachers[(subject, lesson_type)] = lesson.teacher
-
-                    if lesson.teacher == assigned_teachers[(subject, lesson_type)]:
-                        if new_schedule.check_hard_constraints(lesson):
-                            new_schedule.lessons.append(lesson)
+def recombine(schedule1, schedule2, groups, max_lessons_per_day=4):
+    new_schedule = Schedule()
+
+    with telemetry.timer("crossover"):
+        for group in groups:
+            assigned_teachers = {}
+
+            for day in Day:
+                for lesson_num in range(1, max_lessons_per_day + 1):
+                    slot = (group.name, day, lesson_num)
+                    parent_schedule, alt_schedule = schedule1, schedule2
+                    if random.random() >= 0.5:
+                        parent_schedule, alt_schedule = schedule2, schedule1
+
+                    rejected = False
+                    for lesson in parent_schedule.group_slots.get(slot, ()):
+                        course = (lesson.subject, lesson.lesson_type, lesson.subgroup)
+                        if course not in assigned_teachers:
+                            assigned_teachers[course] = lesson.teacher
+
+                        if lesson.teacher != assigned_teachers[course]:
+                            if telemetry.enabled:
+                                telemetry.count("lessons_dropped_crossover")
+                        elif new_schedule.check_hard_constraints(lesson):
+                            new_schedule.add_lesson(lesson)
                         else:
-                            alt_schedule = schedule2 if parent_schedule == schedule1 else schedule1
-                            alt_lesson = next(
-                                (l for l in alt_schedule.lessons
-                                 if l.group == group.name and l.day == day and l.lesson_num == lesson_num),
-                                None
-                            )
-                            if (alt_lesson and
-                                    alt_lesson.teacher == assigned_teachers[(subject, lesson_type)] and
-                                    new_schedule.check_hard_constraints(alt_lesson)):
-                                new_schedule.lessons.append(alt_lesson)
-
-    mutated_schedule = mutation_fixed_group_subjects(new_schedule, groups, teachers, auditoriums, week_quantity)
-    smoothed_schedule = smoothing(mutated_schedule, teachers)
-    mutated_schedule = mutation_fixed_group_subjects(smoothed_schedule, groups, teachers, auditoriums, week_quantity)
-    mutated_schedule = mutate_auditoriums_by_size(mutated_schedule, auditoriums, groups)
-    return mutated_schedule
-
-
-def mutation_fixed_group_subjects(schedule, groups, teachers, auditoriums, week_quantity):
+                            rejected = True
+
+                    if not rejected:
+                        continue
+                    for alt_lesson in alt_schedule.group_slots.get(slot, ()):
+                        if alt_lesson in new_schedule:
+                            continue
+                        course = (alt_lesson.subject, alt_lesson.lesson_type, alt_lesson.subgroup)
+                        if assigned_teachers.setdefault(course, alt_lesson.teacher) != alt_lesson.teacher:
+                            continue
+                        if new_schedule.check_hard_constraints(alt_lesson):
+                            new_schedule.add_lesson(alt_lesson)
+                        elif telemetry.enabled:
+                            telemetry.count("lessons_dropped_crossover")
+    return new_schedule
+
+
+def mutation_fixed_group_subjects(schedule, groups, teachers, auditoriums, week_quantity, problem_index=None):
+    if problem_index is None:
+        problem_index = ProblemIndex(groups, teachers, auditoriums)
+
+    course_lessons = defaultdict(list)
+    subgroup_counts = Counter()
+    for lesson in schedule.lessons:
+        course_lessons[(lesson.group, lesson.subject, lesson.lesson_type)].append(lesson)
+        subgroup_counts[(lesson.group, lesson.subject, lesson.lesson_type, lesson.subgroup)] += 1
+
+    def track_lesson(lesson):
+        course_lessons[(lesson.group, lesson.subject, lesson.lesson_type)].append(lesson)
+        subgroup_counts[(lesson.group, lesson.subject, lesson.lesson_type, lesson.subgroup)] += 1
+
+    def add_lesson(lesson):
+        schedule.add_lesson(lesson)
+        track_lesson(lesson)
+
+    def remove_lesson(lesson):
+        schedule.remove_lesson(lesson)
+        course_lessons[(lesson.group, lesson.subject, lesson.lesson_type)].remove(lesson)
+        subgroup_counts[(lesson.group, lesson.subject, lesson.lesson_type, lesson.subgroup)] -= 1
+
     for group in groups:
+        group_auditoriums = problem_index.auditoriums_for(group.students_count)
         for subject in group.subjects:
             for detail in subject.details:
                 subgroups_count = 1
                 if detail.subgroups is not None:
                     subgroups_count = detail.subgroups
+                whole_group = detail.subgroups == 1 or detail.subgroups is None
+                course_key = (group.name, subject.name, detail.type)
 
                 for subgroup in range(1, subgroups_count + 1):
                     subgroup_name = str(str(subgroup) + "/" + str(subgroups_count))
-                    subject_hours = sum(
-                        1.5 for lesson in schedule.lessons
-                        if lesson.group == group.name and lesson.subject == subject.name and
-                        detail.type == lesson.lesson_type and (detail.subgroups == 1 or detail.subgroups is None or
-                                                               lesson.subgroup == subgroup_name)
-                    )
+                    if whole_group:
+                        lessons_count = len(course_lessons[course_key])
+                    else:
+                        lessons_count = subgroup_counts[course_key + (subgroup_name,)]
+                    subject_hours = 1.5 * lessons_count
                     max_hours = detail.hours / week_quantity
 
                     if subject_hours > max_hours:
                         excess_hours = subject_hours - max_hours
-                        lessons_to_remove = [
-                            lesson for lesson in schedule.lessons
-                            if lesson.group == group.name and lesson.subject == subject.name and
-                               detail.type == lesson.lesson_type and (
-                                       detail.subgroups == 1 or detail.subgroups is None or
-                                       lesson.subgroup == subgroup_name)
-                        ]
+                        lessons_to_remove = schedule.in_schedule_order(
+                            lesson for lesson in course_lessons[course_key]
+                            if whole_group or lesson.subgroup == subgroup_name
+                        )
                         for _ in range(int(excess_hours / 1.5)):
                             lesson_to_random = []
                             for lesson in lessons_to_remove:
@@ -181,31 +254,30 @@ def mutation_fixed_group_subjects(schedule, groups, teachers, auditoriums, week_
                                 lesson_to_random = lessons_to_remove
                             to_delete = random.choice(lesson_to_random)
                             lessons_to_remove.remove(to_delete)
-                            schedule.lessons.remove(to_delete)
+                            remove_lesson(to_delete)
+                            if telemetry.enabled:
+                                telemetry.count("lessons_removed_mutation")
 
                     if subject_hours < max_hours / 2:
                         lack_hours = max_hours - subject_hours
                         existing_lesson = [
-                            lesson for lesson in schedule.lessons
-                            if lesson.group == group.name and lesson.subject == subject.name and
-                               detail.type == lesson.lesson_type and (
-                                       detail.subgroups == 1 or detail.subgroups is None or
-                                       lesson.subgroup == subgroup_name)
+                            lesson for lesson in course_lessons[course_key]
+                            if whole_group or lesson.subgroup == subgroup_name
                         ]
-                        available_teachers = []
-                        if not existing_lesson:
+                        allocated_teacher = problem_index.allocated_teacher(
+                            group.name, subject.name, detail.type,
+                            None if detail.type == "Lec" or subgroups_count == 1 else subgroup_name
+                        )
+                        if allocated_teacher is not None:
+                            available_teachers = [allocated_teacher]
+                        elif not existing_lesson:
                             available_teachers = [
-                                t
-                                for t in teachers
-                                if any(
-                                    ts.name == subject.name and max_hours <= t.hours
-                                    and detail.type in [tsd.type for tsd in ts.details]
-                                    for ts in t.subjects
-                                )
+                                t for t in problem_index.eligible_teachers(subject.name, detail.type)
+                                if max_hours <= t.hours
                             ]
                         else:
-                            teacher = [t for t in teachers if t.name == existing_lesson[0].teacher]
-                            available_teachers.append(teacher[0])
+                            first_lesson = min(existing_lesson, key=schedule.schedule_position)
+                            available_teachers = [problem_index.teachers_by_name[first_lesson.teacher]]
 
                         for _ in range(int(lack_hours / 1.5)):
                             days_list = list(Day)
@@ -213,43 +285,19 @@ def mutation_fixed_group_subjects(schedule, groups, teachers, auditoriums, week_
                             assigned = False
                             for day in days_list:
                                 for i in range(2, 4):
-                                    flag = 0
-                                    for lesson in schedule.lessons:
-                                        if (lesson.group == group.name and lesson.day == day and
-                                                lesson.lesson_num == i and (
-                                                        detail.subgroups == 1 or detail.subgroups is None or
-                                                        lesson.subgroup == subgroup_name)):
-                                            break
-                                        if (lesson.group == group.name and lesson.day == day and
-                                                lesson.lesson_num == i - 1):
-                                            if subgroup is not None and subgroup != 1:
-                                                if lesson.subgroup == subgroup_name:
-                                                    flag += 1
-                                            else:
-                                                flag += 1
-                                        if (lesson.group == group.name and lesson.day == day and
-                                                lesson.lesson_num == i + 1):
-                                            if subgroup is not None and subgroup != 1:
-                                                if lesson.subgroup == subgroup_name:
-                                                    flag += 1
-                                            else:
-                                                flag += 1
+                                    if any(
+                                            whole_group or lesson.subgroup == subgroup_name
+                                            for lesson in schedule.group_slots.get((group.name, day, i), ())
+                                    ):
+                                        continue
+                                    flag = sum(
+                                        1 for neighbour_num in (i - 1, i + 1)
+                                        for lesson in schedule.group_slots.get((group.name, day, neighbour_num), ())
+                                        if subgroup == 1 or lesson.subgroup == subgroup_name
+                                    )
                                     if flag > 1:
                                         for teacher in available_teachers:
-                                            auditorium = random.choice(
-                                                [
-                                                    a
-                                                    for a in auditoriums
-                                                    if a.capacity >= group.students_count
-                                                ]
-                                            )
-                                            if not auditorium:
-                                                auditorium = random.choice(
-                                                    [
-                                                        a
-                                                        for a in auditoriums
-                                                    ]
-                                                )
+                                            auditorium = random.choice(group_auditoriums)
 
                                             if detail.type == "Lec" or subgroups_count == 1:
                                                 subgroup_name = None
@@ -266,86 +314,48 @@ def mutation_fixed_group_subjects(schedule, groups, teachers, auditoriums, week_
                                             )
 
                                             if detail.type == "Lec":
-                                                result_flag, new_lesson = schedule.set_shared_lec(lesson, teacher,
-                                                                                                  subject, group,
-                                                                                                  auditoriums)
+                                                result_flag, new_lesson = schedule.set_shared_lec(lesson)
                                                 if result_flag:
                                                     lesson = new_lesson
 
                                             if schedule.check_hard_constraints(lesson):
-                                                schedule.lessons.append(lesson)
+                                                add_lesson(lesson)
                                                 assigned = True
                                                 break
-                            loop_num = 0
-                            while not assigned and loop_num < 100:
-                                teacher = random.choice(available_teachers)
-                                day = random.choice(days_list)
-                                lesson_num = random.randint(1, 4)
-                                auditorium = random.choice(
-                                    [
-                                        a
-                                        for a in auditoriums
-                                        if a.capacity >= group.students_count
-                                    ]
-                                )
-                                if not auditorium:
-                                    auditorium = random.choice(
-                                        [
-                                            a
-                                            for a in auditoriums
-                                        ]
-                                    )
-
-                                if detail.type == "Lec" or subgroups_count == 1:
-                                    subgroup_name = None
-
-                                lesson = Lesson(
-                                    day,
-                                    lesson_num,
-                                    teacher,
-                                    detail.type,
-                                    subject,
-                                    group,
-                                    auditorium,
-                                    subgroup_name,
-                                )
-
-                                if detail.type == "Lec":
-                                    result_flag, new_lesson = schedule.set_shared_lec(lesson, teacher, subject,
-                                                                                      group, auditoriums)
-                                    if result_flag:
-                                        lesson = new_lesson
-
-                                loop_num += 1
-                                if schedule.check_hard_constraints(lesson):
-                                    schedule.lessons.append(lesson)
-                                    assigned = True
+                            if not assigned:
+                                lesson_subgroup = None if detail.type == "Lec" or subgroups_count == 1 \
+                                    else subgroup_name
+                                for teacher in random.sample(available_teachers, len(available_teachers)):
+                                    lesson = schedule.place_lesson(teacher, detail.type, subject, group,
+                                                                   lesson_subgroup, group_auditoriums, problem_index)
+                                    if lesson is not None:
+                                        track_lesson(lesson)
+                                        assigned = True
+                                        break
+                            if not assigned and telemetry.enabled:
+                                telemetry.count("lessons_dropped_mutation")
     return schedule
 
 
-def smoothing(new_schedule, teachers):
+def smoothing(new_schedule, teachers, max_lessons_per_day=4):
     for teacher in teachers:
-        teacher_lessons = sorted(
-            [lesson for lesson in new_schedule.lessons if lesson.teacher == teacher.name],
-            key=lambda x: (x.day, x.lesson_num)
-        )
-
-        unique_slots = set()
-        for lesson in teacher_lessons:
-            unique_slots.add((lesson.day, lesson.lesson_num))
-
-        teacher_hours = len(unique_slots) * 1.5
+        teacher_hours = new_schedule.teacher_hours(teacher.name)
 
         if teacher_hours > teacher.hours:
             excess_hours = teacher_hours - teacher.hours
 
+            teacher_lessons = new_schedule.in_schedule_order(
+                lesson
+                for day in Day
+                for lesson_num in range(1, max_lessons_per_day + 1)
+                for lesson in new_schedule.teacher_slots.get((teacher.name, day, lesson_num), ())
+            )
             lessons_by_subject_type = {}
-            for lesson in new_schedule.lessons:
-                if lesson.teacher == teacher.name:
-                    key = (lesson.subject, lesson.lesson_type, lesson.group)
-                    if key not in lessons_by_subject_type:
-                        lessons_by_subject_type[key] = []
-                    lessons_by_subject_type[key].append(lesson)
+            for lesson in teacher_lessons:
+                key = (lesson.subject, lesson.lesson_type, lesson.group)
+                if key not in lessons_by_subject_type:
+                    lessons_by_subject_type[key] = []
+                lessons_by_subject_type[key].append(lesson)
 
             while excess_hours > 0 and lessons_by_subject_type:
                 random_key = random.choice(list(lessons_by_subject_type.keys()))
@@ -353,7 +363,9 @@ def smoothing(new_schedule, teachers):
 
                 if excess_hours >= 1.5 * (len(random_group_lessons) - 1):
                     for lesson in random_group_lessons:
-                        new_schedule.lessons.remove(lesson)
+                        new_schedule.remove_lesson(lesson)
+                    if telemetry.enabled:
+                        telemetry.count("lessons_removed_smoothing", len(random_group_lessons))
                     excess_hours -= 1.5 * len(random_group_lessons)
 
                 del lessons_by_subject_type[random_key]
@@ -364,8 +376,10 @@ def smoothing(new_schedule, teachers):
     return new_schedule
 
 
-def mutate_auditoriums_by_size(schedule, auditoriums, groups):
-    new_schedule = copy.deepcopy(schedule)
+def mutate_auditoriums_by_size(schedule, auditoriums, groups, problem_index=None):
+    if problem_index is None:
+        problem_index = ProblemIndex(groups, [], auditoriums)
+    new_schedule = schedule.clone()
     lessons = new_schedule.lessons
 
     for _ in range(5):
@@ -381,25 +395,71 @@ def mutate_auditoriums_by_size(schedule, auditoriums, groups):
         else:
             return new_schedule
 
-        total_students_lesson1 = sum(
-            group.students_count for group in groups if group.name == lesson1.group
-        )
-        total_students_lesson2 = sum(
-            group.students_count for group in groups if group.name == lesson2.group
-        )
+        total_students_lesson1 = problem_index.students_by_group.get(lesson1.group, 0)
+        total_students_lesson2 = problem_index.students_by_group.get(lesson2.group, 0)
 
-        auditorium1 = next((a for a in auditoriums if a.number == lesson1.auditorium), None)
-        auditorium2 = next((a for a in auditoriums if a.number == lesson2.auditorium), None)
+        auditorium1 = problem_index.auditoriums_by_number.get(lesson1.auditorium)
+        auditorium2 = problem_index.auditoriums_by_number.get(lesson2.auditorium)
 
         if auditorium1 and auditorium2:
             if (
                     (total_students_lesson1 > total_students_lesson2 and auditorium1.capacity < auditorium2.capacity) or
                     (total_students_lesson1 < total_students_lesson2 and auditorium1.capacity > auditorium2.capacity)
             ):
-                lesson1.auditorium, lesson2.auditorium = lesson2.auditorium, lesson1.auditorium
+                new_schedule.replace_lesson(lesson1, lesson1.replace(auditorium=lesson2.auditorium))
+                new_schedule.replace_lesson(lesson2, lesson2.replace(auditorium=lesson1.auditorium))
     return new_schedule
 
 
+def assign_auditoriums(schedule, auditoriums, groups, problem_index=None, overflow_weight=1000):
+    if problem_index is None:
+        problem_index = ProblemIndex(groups, [], auditoriums)
+    rooms = problem_index.auditoriums_by_capacity
+    capacities = np.array([auditorium.capacity for auditorium in rooms], dtype=np.float64)
+    students_by_group = problem_index.students_by_group
+
+    sessions_by_slot = defaultdict(list)
+    for (teacher_name, day, lesson_num), session in schedule.teacher_slots.items():
+        students = sum(students_by_group.get(lesson.group, 0) for lesson in session)
+        sessions_by_slot[(day, lesson_num)].append((students, teacher_name, session))
+
+    new_schedule = schedule.clone()
+    for sessions in sessions_by_slot.values():
+        if len(sessions) > len(rooms):
+            continue
+        sessions.sort(key=lambda session: session[:2])
+        students = np.array([session[0] for session in sessions], dtype=np.float64)
+        for session, room_index in zip(sessions, match_sorted(students, capacities, overflow_weight)):
+            auditorium_number = rooms[room_index].number
+            for lesson in session[2]:
+                if lesson.auditorium != auditorium_number:
+                    new_schedule.replace_lesson(lesson, lesson.replace(auditorium=auditorium_number))
+    return new_schedule
+
+
+def match_sorted(demands, capacities, overflow_weight=1000):
+    # Both inputs are sorted ascending and the cost is convex in (demand - capacity),
+    # so an optimal matching never crosses and a DP over prefixes finds it.
+    difference = demands[:, None] - capacities[None, :]
+    costs = overflow_weight * np.maximum(difference, 0) + np.maximum(-difference, 0)
+    session_count, room_count = costs.shape
+    table = np.full((session_count + 1, room_count + 1), np.inf)
+    table[0] = 0
+    for i in range(1, session_count + 1):
+        taken = table[i - 1, :-1] + costs[i - 1]
+        taken[:i - 1] = np.inf
+        table[i, 1:] = np.minimum.accumulate(taken)
+
+    matching = [0] * session_count
+    j = room_count
+    for i in range(session_count, 0, -1):
+        while table[i, j] == table[i, j - 1]:
+            j -= 1
+        matching[i - 1] = j - 1
+        j -= 1
+    return matching
+
+
 def calculate_similarity(schedule1, schedule2):
     lessons1 = set(
         (l.day, l.lesson_num, l.teacher, l.group, l.lesson_type, l.subject, l.auditorium)
@@ -415,27 +475,98 @@ def calculate_similarity(schedule1, schedule2):
     return intersection / union if union > 0 else 0.0
 
 
-def group_schedules(schedule_pool, similarity_threshold=1.0):
+def schedule_fingerprint(schedule):
+    return np.unique(np.fromiter(
+        (hash((l.day, l.lesson_num, l.teacher, l.group, l.lesson_type, l.subject, l.auditorium))
+         for l in schedule.lessons),
+        dtype=np.int64,
+        count=len(schedule.lessons),
+    ))
+
+
+def minhash_signatures(fingerprints, num_perm=128, seed=0):
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(fingerprints), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i, fingerprint in enumerate(fingerprints):
+        if len(fingerprint):
+            hashed = fingerprint.view(np.uint64)[:, None] * multipliers + offsets
+            signatures[i] = (hashed >> np.uint64(32)).min(axis=0)
+    return signatures.astype(np.uint32)
+
+
+SIMILARITY_EXACT_LIMIT = 500
+SIMILARITY_CHUNK_ENTRIES = 1 << 22
+
+
+def similarity_matrix(schedule_pool, num_perm=None, exact_limit=SIMILARITY_EXACT_LIMIT):
+    fingerprints = [schedule.cached("fingerprint", schedule_fingerprint) for schedule, _ in schedule_pool]
+    num_schedules = len(fingerprints)
+    if num_schedules == 0:
+        return np.zeros((0, 0))
+    sizes = np.array([len(fingerprint) for fingerprint in fingerprints])
+    if num_perm is None and exact_limit is not None and num_schedules > exact_limit:
+        num_perm = 128
+
+    if num_perm is None:
+        intersection = exact_intersections(fingerprints, sizes)
+        union = sizes[:, None] + sizes[None, :] - intersection
+    else:
+        signatures = minhash_signatures(fingerprints, num_perm)
+        matches = np.empty((num_schedules, num_schedules), dtype=np.uint16)
+        block_rows = max(1, SIMILARITY_CHUNK_ENTRIES // (num_schedules * num_perm))
+        for start in range(0, num_schedules, block_rows):
+            block = signatures[start:start + block_rows]
+            matches[start:start + block_rows] = (block[:, None, :] == signatures[None, :, :]).sum(
+                axis=2, dtype=np.uint16
+            )
+        jaccard = matches / num_perm
+        union = (sizes[:, None] + sizes[None, :]) / (1 + jaccard)
+        intersection = jaccard * union
+
+    half_union = np.floor(union / 2)
+    return np.where(half_union > 0, intersection / np.maximum(half_union, 1), 0.0)
+
+
+def exact_intersections(fingerprints, sizes):
+    num_schedules = len(fingerprints)
+    vocabulary, columns = np.unique(np.concatenate(fingerprints), return_inverse=True)
+    rows = np.repeat(np.arange(num_schedules), sizes)
+    order = np.argsort(columns, kind="stable")
+    rows, columns = rows[order], columns[order]
+
+    intersection = np.zeros((num_schedules, num_schedules), dtype=np.float64)
+    chunk_width = max(1, SIMILARITY_CHUNK_ENTRIES // num_schedules)
+    bounds = np.searchsorted(columns, np.arange(0, len(vocabulary) + chunk_width, chunk_width))
+    for start, end, first_column in zip(bounds[:-1], bounds[1:], range(0, len(vocabulary), chunk_width)):
+        if start == end:
+            continue
+        block = np.zeros((num_schedules, chunk_width), dtype=np.float32)
+        block[rows[start:end], columns[start:end] - first_column] = 1
+        intersection += block @ block.T
+    return np.rint(intersection)
+
+
+def group_schedules(schedule_pool, similarity_threshold=1.0, similarity=None):
+    if similarity is None:
+        similarity = similarity_matrix(schedule_pool)
     num_schedules = len(schedule_pool)
-    visited = set()
+    visited = np.zeros(num_schedules, dtype=bool)
     clusters = []
 
     for i in range(num_schedules):
-        if i not in visited:
-            cluster = [i]
-            visited.add(i)
-            for j in range(num_schedules):
-                if j != i and j not in visited:
-                    similarity = calculate_similarity(schedule_pool[i][0], schedule_pool[j][0])
-                    if similarity >= similarity_threshold:
-                        cluster.append(j)
-                        visited.add(j)
-            clusters.append(cluster)
+        if not visited[i]:
+            visited[i] = True
+            members = np.flatnonzero((similarity[i] >= similarity_threshold) & ~visited)
+            visited[members] = True
+            clusters.append([i] + members.tolist())
     return clusters
 
 
-def predator_approach(schedules_tuple, clusters, retain_count=8):
+def predator_approach(schedules_tuple, clusters, retain_count=8, return_indices=False):
     new_schedules_tuples = []
+    retained_indices = []
 
     for cluster in clusters:
         if len(cluster) > retain_count:
@@ -448,173 +579,116 @@ def predator_approach(schedules_tuple, clusters, retain_count=8):
 
         for idx in best_indices:
             new_schedules_tuples.append(schedules_tuple[idx])
+            retained_indices.append(idx)
 
+    if return_indices:
+        return retained_indices
     return new_schedules_tuples
 
 
-def rain_effect(schedules_collection, max_num, teachers, auditoriums, groups, change_num=10, max_attempts=50):
-    clusters = group_schedules(schedules_collection, similarity_threshold=0.8)
+def rain_effect(schedules_collection, max_num, teachers, auditoriums, groups, week_quantity, change_num=10,
+                max_attempts=50, max_loss=None, similarity=None, problem_index=None, max_failures=10):
+    if problem_index is None:
+        problem_index = ProblemIndex(groups, teachers, auditoriums)
+    # Allocated courses have a single teacher, so change_teacher can never succeed for them.
+    actions = (1,) if problem_index.teacher_allocation else (0, 1)
+    clusters = group_schedules(schedules_collection, similarity_threshold=0.8, similarity=similarity)
 
     sorted_clusters = sorted(clusters, key=lambda x: len(x))
     num_clusters_to_rain = len(sorted_clusters) // 2
     target_clusters = sorted_clusters[:num_clusters_to_rain]
 
-    new_schedules = copy.deepcopy(schedules_collection)
+    new_schedules = list(schedules_collection)
+    if telemetry.enabled:
+        telemetry.count("rain_events")
 
     for cluster in target_clusters:
         base_schedules_idx = random.choices(cluster, k=ceil(len(cluster) / 2))
         for base_schedule_idx in base_schedules_idx:
-            while len(new_schedules) <= max_num:
-                new_schedule = copy.deepcopy(schedules_collection[base_schedule_idx][0])
+            failures = 0
+            while len(new_schedules) <= max_num and failures < max_failures:
+                new_schedule = schedules_collection[base_schedule_idx][0].clone()
+                new_schedule.ledger = FitnessLedger.from_schedule(new_schedule, groups, teachers, auditoriums,
+                                                                  week_quantity, problem_index)
                 changes_made = 0
                 attempts = 0
 
                 while attempts < max_attempts:
-                    action = random.choice([0, 1])
+                    action = random.choice(actions)
 
                     if action == 0:
-                        if change_teacher(new_schedule, teachers):
+                        if change_teacher(new_schedule, teachers, max_loss, problem_index):
                             changes_made += 1
                     else:
-                        if change_auditorium(new_schedule, auditoriums, groups):
+                        if change_auditorium(new_schedule, auditoriums, groups, max_loss, problem_index):
                             changes_made += 1
 
                     attempts += 1
                 if changes_made >= change_num:
-                    new_schedules.append(new_schedule)
+                    fitness_score = new_schedule.ledger.score
+                    new_schedule.ledger = None
+                    new_schedules.append((new_schedule, fitness_score))
+                    if telemetry.enabled:
+                        telemetry.count("rain_schedules_added")
+                else:
+                    failures += 1
 
     return new_schedules
 
 
-def change_teacher(schedule, teachers):
+def move_accepted(schedule, lesson, new_lesson, max_loss=None):
+    if max_loss is None or schedule.ledger is None:
+        return True
+    return schedule.ledger.move_delta((lesson,), (new_lesson,)) >= -max_loss
+
+
+def change_teacher(schedule, teachers, max_loss=None, problem_index=None):
+    if problem_index is None:
+        problem_index = ProblemIndex([], teachers, [])
     lesson = random.choice(schedule.lessons)
-    copy_lesson = copy.deepcopy(lesson)
     eligible_teachers = [
-        teacher for teacher in teachers
-        if lesson.subject in teacher.subjects and teacher.name != lesson.teacher
+        teacher for teacher in problem_index.course_teachers(lesson.group, lesson.subject, lesson.lesson_type,
+                                                             lesson.subgroup)
+        if teacher.name != lesson.teacher
     ]
 
     if eligible_teachers:
-        schedule.lessons.remove(lesson)
         new_teacher = random.choice(eligible_teachers)
-        copy_lesson.teacher = new_teacher.name
-        if schedule.check_hard_constraints(copy_lesson):
-            schedule.lessons.append(copy_lesson)
+        new_lesson = lesson.replace(teacher=new_teacher.name)
+        if not move_accepted(schedule, lesson, new_lesson, max_loss):
+            return False
+        schedule.remove_lesson(lesson)
+        if schedule.check_hard_constraints(new_lesson):
+            schedule.add_lesson(new_lesson)
             return True
-        schedule.lessons.append(lesson)
+        schedule.add_lesson(lesson)
     return False
 
 
-def change_auditorium(schedule, auditoriums, groups):
+def change_auditorium(schedule, auditoriums, groups, max_loss=None, problem_index=None):
+    if problem_index is None:
+        problem_index = ProblemIndex(groups, [], auditoriums)
     lesson = random.choice(schedule.lessons)
-    copy_lesson = copy.deepcopy(lesson)
-    eligible_auditoriums = [
-        auditorium for auditorium in auditoriums
-        if auditorium.capacity >= sum(group.students_count for group in groups if group.name == lesson.group)
-    ]
+    eligible_auditoriums = problem_index.auditoriums_for(
+        problem_index.students_by_group.get(lesson.group, 0), strict=True
+    )
 
     if eligible_auditoriums:
-        schedule.lessons.remove(lesson)
         new_auditorium = random.choice(eligible_auditoriums)
-        copy_lesson.auditorium = new_auditorium.number
-        if schedule.check_hard_constraints(copy_lesson):
-            schedule.lessons.append(copy_lesson)
+        new_lesson = lesson.replace(auditorium=new_auditorium.number)
+        if not move_accepted(schedule, lesson, new_lesson, max_loss):
+            return False
+        schedule.remove_lesson(lesson)
+        if schedule.check_hard_constraints(new_lesson):
+            schedule.add_lesson(new_lesson)
             return True
-        schedule.lessons.append(lesson)
+        schedule.add_lesson(lesson)
     return False
 
 
 if __name__ == "__main__":
-    file_path = "schedule_data.xlsx"
-    init_groups, init_teachers, init_auditoriums = load_data_from_excel(file_path)
-    gen_subjects, gen_teachers, gen_groups, gen_auditoriums = test_generate(
-        5, 5, 10, 8
-        # 0, 0, 0, 0
-    )
-    week_quantity = 14
-
-    groups = gen_groups + init_groups
-    teachers = gen_teachers + init_teachers
-    auditoriums = gen_auditoriums + init_auditoriums
-
-    schedules_collection = []
+    import sys
 
-    specimen_num = 100
-    iter_num = 400
-
-    try:
-        for i in range(specimen_num):
-            schedule = Schedule()
-            schedule.generate_schedule(
-                groups=groups, teachers=teachers, auditoriums=auditoriums, week_quantity=week_quantity
-            )
-            fitness_score = fitness_soft(schedule, groups, teachers, auditoriums, week_quantity, False)
-            schedules_collection.append((schedule, fitness_score))
-    except Exception as e:
-        print(f"{e}")
-        exit(0)
-
-    num_iter_no_change = (None, 0)
-    for i in range(iter_num):
-
-        clusters = group_schedules(schedules_collection, similarity_threshold=0.8)
-        # for idx, cluster in enumerate(clusters):
-        #     if len(cluster) > 1:
-        #         print(f"Cluster {idx}: {cluster}")
-
-        clean_schedule_collection = predator_approach(schedules_collection, clusters,
-                                                      retain_count=max(floor(0.1 * specimen_num), 4))
-
-        sorted_items = sorted(
-            clean_schedule_collection,
-            key=lambda x: x[1],
-            reverse=True
-        )
-
-        half_size = specimen_num // 2
-        if half_size < len(sorted_items):
-            sorted_items = sorted_items[:half_size]
-        schedules_collection = sorted_items
-
-
-        half_num = len(sorted_items) // 4
-        if (sorted_items[-half_num][1] - sorted_items[half_num][1]) < 2 and (
-                num_iter_no_change[0] == sorted_items[-half_num][1]
-                or num_iter_no_change[0] is None):
-            num_iter_no_change = (sorted_items[-half_num][1], num_iter_no_change[1] + 1)
-            print("The results change weakly")
-        else:
-            num_iter_no_change = (sorted_items[-half_num][1], 0)
-
-
-        if num_iter_no_change[1] == 5:
-            rain_effect(schedules_collection, specimen_num, teachers, auditoriums, groups, change_num=10, max_attempts=200)
-            num_iter_no_change = (None, 0)
-
-        print()
-        print(f"Best of iter {i}: ")
-        for fi in range(0, len(sorted_items)):
-            print(sorted_items[fi][1])
-
-        for j in range(specimen_num - len(sorted_items)):
-            random_parent1 = random.randint(0, half_size - 1)
-            random_parent2 = random.randint(0, half_size - 1)
-            while random_parent1 == random_parent2:
-                random_parent2 = random.randint(0, half_size - 1)
-
-            child_schedule = crossover(sorted_items[random_parent1][0],
-                                       sorted_items[random_parent2][0], groups, teachers, week_quantity, auditoriums)
-            fitness_score = fitness_soft(child_schedule, groups, teachers, auditoriums, week_quantity, False)
-            schedules_collection.append((child_schedule, fitness_score))
-
-    schedules_collection = sorted(
-        schedules_collection,
-        key=lambda x: x[1],
-        reverse=True
-    )
+    from engine import cli
 
-    print()
-    print("BEST:")
-    print("Hard constraints:", schedules_collection[0][0].hard_constraints_schedule_check())
-    fitness_soft(schedules_collection[0][0], groups, teachers, auditoriums, week_quantity, True)
-    export_schedule_to_excel(schedules_collection[0][0], groups, auditoriums, "schedule.xlsx")
+    sys.exit(cli(["--generate", "5", "5", "10", "8", *sys.argv[1:]]))
@@ -0,0 +1,93 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from main import DEFAULT_OPERATOR_PLAN, ProblemIndex, Schedule, assign_auditoriums, crossover, fitness_soft
+
+_problem = None
+
+
+def _init_worker(groups, teachers, auditoriums, week_quantity, construction_mode="random",
+                 balance_teacher_load=False, assign_rooms=False, teacher_allocation=None):
+    global _problem
+    problem_index = ProblemIndex(groups, teachers, auditoriums)
+    problem_index.teacher_allocation = teacher_allocation
+    _problem = (groups, teachers, auditoriums, week_quantity, problem_index, construction_mode, balance_teacher_load,
+                assign_rooms)
+
+
+def _generate_task(task_seed):
+    random.seed(task_seed)
+    (groups, teachers, auditoriums, week_quantity, problem_index, construction_mode, balance_teacher_load,
+     assign_rooms) = _problem
+    schedule = Schedule()
+    schedule.generate_schedule(
+        groups=groups, teachers=teachers, auditoriums=auditoriums, week_quantity=week_quantity,
+        problem_index=problem_index, mode=construction_mode, balance_teacher_load=balance_teacher_load
+    )
+    if assign_rooms:
+        schedule = assign_auditoriums(schedule, auditoriums, groups, problem_index)
+    return schedule, fitness_soft(schedule, groups, teachers, auditoriums, week_quantity, False, problem_index)
+
+
+def _crossover_task(task):
+    schedule1, schedule2, task_seed, operator_plan, log_operators = task
+    random.seed(task_seed)
+    groups, teachers, auditoriums, week_quantity, problem_index = _problem[:5]
+    if operator_plan is None:
+        operator_plan = DEFAULT_OPERATOR_PLAN
+    operator_log = [] if log_operators else None
+    child_schedule = crossover(schedule1, schedule2, groups, teachers, week_quantity, auditoriums,
+                               problem_index=problem_index, operator_plan=operator_plan, operator_log=operator_log)
+    return child_schedule, fitness_soft(child_schedule, groups, teachers, auditoriums, week_quantity, False,
+                                        problem_index), operator_log
+
+
+class ParallelPopulation:
+    def __init__(self, groups, teachers, auditoriums, week_quantity, workers=None, seed=None,
+                 construction_mode="random", balance_teacher_load=False, assign_rooms=False,
+                 teacher_allocation=None):
+        self.rng = random.Random(seed)
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(groups, teachers, auditoriums, week_quantity, construction_mode, balance_teacher_load,
+                      assign_rooms, teacher_allocation),
+        )
+
+    def _task_seeds(self, count):
+        return [self.rng.getrandbits(64) for _ in range(count)]
+
+    def _chunksize(self, count):
+        return max(1, count // (self.workers * 4))
+
+    def generate(self, count):
+        return list(self.executor.map(_generate_task, self._task_seeds(count), chunksize=self._chunksize(count)))
+
+    def breed(self, parent_pairs, operator_plans=None, operator_logs=None):
+        if operator_plans is None:
+            operator_plans = [None] * len(parent_pairs)
+        log_operators = operator_logs is not None
+        tasks = [
+            (schedule1, schedule2, task_seed, operator_plan, log_operators)
+            for (schedule1, schedule2), task_seed, operator_plan in zip(
+                parent_pairs, self._task_seeds(len(parent_pairs)), operator_plans
+            )
+        ]
+        children = []
+        for child_schedule, score, operator_log in self.executor.map(_crossover_task, tasks,
+                                                                     chunksize=self._chunksize(len(tasks))):
+            children.append((child_schedule, score))
+            if log_operators:
+                operator_logs.append(operator_log)
+        return children
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,118 @@
+import contextlib
+import json
+import time
+from collections import Counter, defaultdict
+
+
+class _Timer:
+    __slots__ = ("telemetry", "name", "start")
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.telemetry.operator_seconds[self.name] += time.perf_counter() - self.start
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Telemetry:
+    def __init__(self):
+        self.enabled = False
+        self.observers = []
+        self.counters = Counter()
+        self.operator_seconds = defaultdict(float)
+        self.generation_start = None
+
+    def enable(self):
+        self.enabled = True
+        self.reset()
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.counters = Counter()
+        self.operator_seconds = defaultdict(float)
+        self.generation_start = time.perf_counter()
+
+    def subscribe(self, observer):
+        self.observers.append(observer)
+        return observer
+
+    def unsubscribe(self, observer):
+        self.observers.remove(observer)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def start_generation(self):
+        if self.enabled:
+            self.reset()
+
+    def end_generation(self, generation, **stats):
+        if not self.enabled:
+            return None
+        record = {
+            "generation": generation,
+            "wall_seconds": time.perf_counter() - self.generation_start,
+            "operator_seconds": dict(self.operator_seconds),
+            "counters": dict(self.counters),
+            **stats,
+        }
+        for observer in self.observers:
+            observer(record)
+        self.reset()
+        return record
+
+
+class JsonlLogger:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a")
+
+    def __call__(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ProgressReporter:
+    def __init__(self, every=10, min_interval=0.0, output=print):
+        self.every = every
+        self.min_interval = min_interval
+        self.output = output
+        self.last_report = None
+
+    def __call__(self, record):
+        now = time.perf_counter()
+        if record["generation"] % self.every != 0:
+            return
+        if self.last_report is not None and now - self.last_report < self.min_interval:
+            return
+        self.last_report = now
+        operators = ", ".join(
+            f"{name} {seconds:.2f}s"
+            for name, seconds in sorted(record["operator_seconds"].items(), key=lambda item: -item[1])
+        )
+        self.output(
+            f"Iter {record['generation']}: best {record.get('best_fitness')}, "
+            f"{record['wall_seconds']:.2f}s ({operators})"
+        )
+
+
+telemetry = Telemetry()
@@ -0,0 +1,42 @@
+from collections import Counter
+
+from classes import Auditorium, Group, Subject, SubjectDetail, Teacher
+from compact import ScheduleEncoding
+from islands import IslandModel, decode_items, encode_items
+
+
+def practice_problem():
+    groups = [
+        Group(f"Group{i}", 20 + i, [
+            Subject("Math", [SubjectDetail("Lec", 42), SubjectDetail("Prac", 42)]),
+            Subject("Physics", [SubjectDetail("Lec", 21), SubjectDetail("Lab", 42, 2)]),
+        ])
+        for i in range(1, 4)
+    ]
+    teachers = [
+        Teacher("Teacher1", [Subject("Math", [SubjectDetail("Lec"), SubjectDetail("Prac")])], 30),
+        Teacher("Teacher2", [Subject("Math", [SubjectDetail("Prac")]),
+                             Subject("Physics", [SubjectDetail("Lec")])], 30),
+        Teacher("Teacher3", [Subject("Physics", [SubjectDetail("Lec"), SubjectDetail("Lab")])], 30),
+    ]
+    auditoriums = [Auditorium(f"A{i}", 40) for i in range(1, 6)]
+    return groups, teachers, auditoriums
+
+
+def test_from_problem_interns_every_lesson_type_in_a_fixed_order():
+    groups, teachers, auditoriums = practice_problem()
+    encoding = ScheduleEncoding.from_problem(groups, teachers, auditoriums)
+    assert encoding.values["lesson_type"] == ["Lec", "Lab", "Prac"]
+
+
+def test_practice_lessons_survive_island_migration():
+    groups, teachers, auditoriums = practice_problem()
+    model = IslandModel(groups, teachers, auditoriums, week_quantity=14, islands=2, migration_interval=2,
+                        migrants=2, seed=3, population_size=8, max_generations=4)
+    best, score = model.solve()
+
+    lesson_types = {lesson.lesson_type for lesson in best.lessons}
+    assert "Prac" in lesson_types
+    round_trip = decode_items(encode_items([(best, score)], model.encoding), model.encoding)[0][0]
+    assert Counter(lesson.values() for lesson in round_trip.lessons) == \
+        Counter(lesson.values() for lesson in best.lessons)
@@ -0,0 +1,34 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from main import match_sorted
+
+
+def matching_cost(demands, capacities, matching, overflow_weight=1000):
+    return sum(
+        overflow_weight * max(demands[i] - capacities[j], 0) + max(capacities[j] - demands[i], 0)
+        for i, j in enumerate(matching)
+    )
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_match_sorted_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(300):
+        session_count = rng.randint(1, 5)
+        room_count = rng.randint(session_count, 7)
+        demands = np.sort(np.array([rng.choice((10, 20, 30, 45, 60, 90, 120)) for _ in range(session_count)],
+                                   dtype=float))
+        capacities = np.sort(np.array([rng.choice((15, 25, 30, 50, 80, 100)) for _ in range(room_count)],
+                                      dtype=float))
+        matching = match_sorted(demands, capacities)
+
+        assert len(set(matching)) == session_count
+        best = min(
+            matching_cost(demands, capacities, permutation)
+            for permutation in itertools.permutations(range(room_count), session_count)
+        )
+        assert matching_cost(demands, capacities, matching) == best